@@ -0,0 +1,57 @@
+import threading
+from datetime import timedelta
+
+import numpy as np
+import pandas as pd
+
+
+class DailyActivityCounter:
+    """
+    Running count of events per (user, day) for the live app, the streaming
+    counterpart of the `groupby(['user_id', 'date']).size()` feature used in
+    training.
+
+    Only the newest `retention_days` days are kept. When an event from a new
+    day arrives the counter rolls over and older days are evicted, so memory
+    is bounded by the number of users active in that window. Events older
+    than the window are counted as the first event of their day and are not
+    stored. Events without a day (null or unparseable timestamps) leave the
+    counter alone and get NaN, as they do in training.
+    """
+
+    def __init__(self, retention_days=2):
+        self.retention_days = retention_days
+        self._days = {}
+        self._latest_day = None
+        self._lock = threading.Lock()
+
+    def _roll_over(self, day):
+        self._latest_day = day
+        oldest_kept = day - timedelta(days=self.retention_days - 1)
+        for stale_day in [d for d in self._days if d < oldest_kept]:
+            del self._days[stale_day]
+
+    def _increment(self, user_id, day):
+        if day is None or pd.isna(day):
+            return np.nan
+        if self._latest_day is None or day > self._latest_day:
+            self._roll_over(day)
+        elif day <= self._latest_day - timedelta(days=self.retention_days):
+            return 1
+        counts = self._days.setdefault(day, {})
+        counts[user_id] = counts.get(user_id, 0) + 1
+        return counts[user_id]
+
+    def increment(self, user_id, day):
+        """Records one event and returns the user's count so far that day."""
+        with self._lock:
+            return self._increment(user_id, day)
+
+    def increment_many(self, user_ids, days):
+        """Vector form of `increment` for a batch of events, in batch order."""
+        with self._lock:
+            return np.fromiter(
+                (self._increment(user_id, day) for user_id, day in zip(user_ids, days)),
+                dtype=np.float64,
+                count=len(user_ids),
+            )
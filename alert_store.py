@@ -0,0 +1,107 @@
+import json
+import sqlite3
+import threading
+from collections import deque
+
+
+class AlertStore:
+    """
+    Holds the most recent `max_in_memory` alerts in a ring buffer and, when
+    `db_path` is given, also spills every alert to a SQLite table indexed by
+    user_id and timestamp so the full history stays queryable.
+
+    Every alert gets an increasing integer `id`. Queries return alerts newest
+    first and page with that id: pass the returned `next_cursor` back as
+    `cursor` to get the next (older) page.
+    """
+
+    def __init__(self, max_in_memory=10000, db_path=None):
+        self._buffer = deque(maxlen=max_in_memory)
+        self._lock = threading.Lock()
+        self._next_id = 1
+        self._db = None
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.executescript("""
+                CREATE TABLE IF NOT EXISTS alerts (
+                    id INTEGER PRIMARY KEY,
+                    timestamp TEXT,
+                    user_id TEXT,
+                    data TEXT NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS idx_alerts_user_timestamp ON alerts (user_id, timestamp);
+                CREATE INDEX IF NOT EXISTS idx_alerts_timestamp ON alerts (timestamp);
+            """)
+            last_id = self._db.execute("SELECT MAX(id) FROM alerts").fetchone()[0]
+            self._next_id = (last_id or 0) + 1
+
+    def add_many(self, alerts):
+        """Assigns ids to the alerts and stores them."""
+        with self._lock:
+            for alert in alerts:
+                alert['id'] = self._next_id
+                self._next_id += 1
+                self._buffer.append(alert)
+            if self._db is not None and alerts:
+                self._db.executemany(
+                    "INSERT INTO alerts (id, timestamp, user_id, data) VALUES (?, ?, ?, ?)",
+                    [(a['id'], a.get('timestamp'), a.get('user_id'), json.dumps(a)) for a in alerts],
+                )
+                self._db.commit()
+
+    def recent(self, n):
+        """The last `n` alerts, oldest first."""
+        with self._lock:
+            start = max(len(self._buffer) - n, 0)
+            return [self._buffer[i] for i in range(start, len(self._buffer))]
+
+    def query(self, user_id=None, since=None, until=None, cursor=None, limit=100):
+        """
+        Returns `(alerts, next_cursor)` for alerts matching the filters,
+        newest first. `since` and `until` are inclusive timestamp strings in
+        the same 'YYYY-MM-DD HH:MM:SS' form the alerts are stored with.
+        `next_cursor` is None when there are no older matches.
+        """
+        with self._lock:
+            if self._db is not None:
+                matches = self._query_db(user_id, since, until, cursor, limit + 1)
+            else:
+                matches = self._query_buffer(user_id, since, until, cursor, limit + 1)
+        if len(matches) > limit:
+            matches = matches[:limit]
+            return matches, matches[-1]['id']
+        return matches, None
+
+    def _query_buffer(self, user_id, since, until, cursor, limit):
+        matches = []
+        for alert in reversed(self._buffer):
+            if cursor is not None and alert['id'] >= cursor:
+                continue
+            if user_id is not None and alert.get('user_id') != user_id:
+                continue
+            timestamp = alert.get('timestamp')
+            if since is not None and (timestamp is None or timestamp < since):
+                continue
+            if until is not None and (timestamp is None or timestamp > until):
+                continue
+            matches.append(alert)
+            if len(matches) == limit:
+                break
+        return matches
+
+    def _query_db(self, user_id, since, until, cursor, limit):
+        conditions, params = [], []
+        for clause, value in [
+            ("id < ?", cursor),
+            ("user_id = ?", user_id),
+            ("timestamp >= ?", since),
+            ("timestamp <= ?", until),
+        ]:
+            if value is not None:
+                conditions.append(clause)
+                params.append(value)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        rows = self._db.execute(
+            f"SELECT data FROM alerts {where} ORDER BY id DESC LIMIT ?", params + [limit]
+        ).fetchall()
+        return [json.loads(row[0]) for row in rows]
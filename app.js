@@ -1,44 +1,85 @@
+// 🔗 Backend API
+const API_BASE = "http://127.0.0.1:5000";
+const MAX_ALERTS = 10;
+
+let recentAlerts = [];
+
+function renderStats(stats) {
+  let statsEl = document.getElementById("stats");
+  statsEl.innerHTML = "";
+  for (let [key, val] of Object.entries(stats)) {
+    let div = document.createElement("div");
+    div.className = "card";
+    div.innerHTML = `<h3>${key}</h3><p>${val}</p>`;
+    statsEl.appendChild(div);
+  }
+}
+
+function renderAlerts() {
+  let alertsEl = document.getElementById("alerts");
+  alertsEl.innerHTML = "";
+  recentAlerts.forEach(a => {
+    let div = document.createElement("div");
+    div.className = `alert ${a.level}`;
+    div.innerHTML = `<b>${a.level.toUpperCase()}</b> - ${a.user}: ${a.message}`;
+    alertsEl.appendChild(div);
+  });
+}
+
+function renderHighRiskUsers(users) {
+  let usersEl = document.getElementById("highRiskUsers");
+  usersEl.innerHTML = "";
+  users.forEach(u => {
+    let div = document.createElement("div");
+    div.className = "user-card";
+    div.innerHTML = `<b>${u.name}</b> (${u.department})<br>
+                     Risk Score: ${u.score}/100`;
+    usersEl.appendChild(div);
+  });
+}
+
 async function loadDashboard() {
   try {
-    // 🔗 Fetch from your backend API
-    let res = await fetch("http://127.0.0.1:5000/api/dashboard");
+    let res = await fetch(`${API_BASE}/api/dashboard`);
     let data = await res.json();
 
-    // Stats
-    let statsEl = document.getElementById("stats");
-    statsEl.innerHTML = "";
-    for (let [key, val] of Object.entries(data.stats)) {
-      let div = document.createElement("div");
-      div.className = "card";
-      div.innerHTML = `<h3>${key}</h3><p>${val}</p>`;
-      statsEl.appendChild(div);
-    }
-
-    // Alerts
-    let alertsEl = document.getElementById("alerts");
-    alertsEl.innerHTML = "";
-    data.alerts.forEach(a => {
-      let div = document.createElement("div");
-      div.className = `alert ${a.level}`;
-      div.innerHTML = `<b>${a.level.toUpperCase()}</b> - ${a.user}: ${a.message}`;
-      alertsEl.appendChild(div);
-    });
-
-    // High-risk users
-    let usersEl = document.getElementById("highRiskUsers");
-    usersEl.innerHTML = "";
-    data.high_risk_users.forEach(u => {
-      let div = document.createElement("div");
-      div.className = "user-card";
-      div.innerHTML = `<b>${u.name}</b> (${u.department})<br>
-                       Risk Score: ${u.score}/100`;
-      usersEl.appendChild(div);
-    });
+    renderStats(data.stats);
+    recentAlerts = data.alerts;
+    renderAlerts();
+    renderHighRiskUsers(data.high_risk_users);
   } catch (err) {
     console.error("Failed to load dashboard", err);
   }
 }
 
-// Auto-refresh every 10s
-loadDashboard();
-setInterval(loadDashboard, 10000);
+// Live updates pushed by the backend instead of polling
+function subscribeToUpdates() {
+  let source = new EventSource(`${API_BASE}/api/stream`);
+
+  // Resync the full dashboard on every (re)connect, then apply pushes
+  source.onopen = loadDashboard;
+
+  source.addEventListener("alert", e => {
+    recentAlerts.push(JSON.parse(e.data));
+    recentAlerts = recentAlerts.slice(-MAX_ALERTS);
+    renderAlerts();
+  });
+
+  source.addEventListener("stats", e => {
+    let data = JSON.parse(e.data);
+    renderStats(data.stats);
+    renderHighRiskUsers(data.high_risk_users);
+  });
+
+  source.onerror = err => {
+    console.error("Dashboard stream interrupted, reconnecting...", err);
+  };
+}
+
+if (window.EventSource) {
+  subscribeToUpdates();
+} else {
+  // Auto-refresh every 10s on browsers without Server-Sent Events
+  loadDashboard();
+  setInterval(loadDashboard, 10000);
+}
@@ -1,16 +1,78 @@
-from fastapi import FastAPI, Request
+import asyncio
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import Optional
+
+from fastapi import FastAPI, HTTPException, Query, Request
 from fastapi.templating import Jinja2Templates
 from fastapi.middleware.cors import CORSMiddleware
-import joblib
+from fastapi.responses import PlainTextResponse, StreamingResponse
 import pandas as pd
 import numpy as np
-from tensorflow.keras.models import load_model
-import tensorflow as tf
+
+from activity_state import DailyActivityCounter
+from alert_store import AlertStore
+from broadcaster import Broadcaster
+from calibrate_threshold import ALERT_THRESHOLD_FILENAME, load_alert_threshold
+from content_store import CONTENT_STORE, ContentStore
+from dashboard_stats import DashboardAggregator, alert_level, risk_score
+from feature_schema import FeatureSchema
+from keyword_matcher import URL_KEYWORD_CATEGORIES, KeywordMatcher
+from metrics import MetricsRegistry
+from micro_batcher import MicroBatcher
+from user_thresholds import SKETCH_FILENAME, UserErrorSketches
+from window_features import WINDOW_FEATURES, WindowFeatureState
+
+# --- Configuration ---
+# Single-event /predict calls are grouped into one model call. A batch is
+# sent as soon as it is full or its oldest event has waited this long.
+BATCH_MAX_SIZE = int(os.environ.get('UBA_BATCH_MAX_SIZE', '64'))
+BATCH_MAX_WAIT_MS = float(os.environ.get('UBA_BATCH_MAX_WAIT_MS', '5'))
+# Threads that run feature preparation and model inference off the event
+# loop, so other requests are served while a batch is being scored
+INFERENCE_WORKERS = int(os.environ.get('UBA_INFERENCE_WORKERS', str(os.cpu_count() or 1)))
+# Seconds between keep-alive comments on idle /api/stream connections
+STREAM_KEEPALIVE_SECONDS = float(os.environ.get('UBA_STREAM_KEEPALIVE_SECONDS', '15'))
+# 'keras' serves final_autoencoder_model.h5, 'numpy' serves the weights
+# exported by export_autoencoder.py without importing TensorFlow.
+INFERENCE_ENGINE = os.environ.get('UBA_INFERENCE_ENGINE', 'keras')
+# How many recent days of per-user activity counts to keep for late events
+ACTIVITY_RETENTION_DAYS = int(os.environ.get('UBA_ACTIVITY_RETENTION_DAYS', '2'))
+# Alerts kept in memory, plus an optional SQLite file holding all of them
+ALERT_BUFFER_SIZE = int(os.environ.get('UBA_ALERT_BUFFER_SIZE', '10000'))
+ALERT_DB_PATH = os.environ.get('UBA_ALERT_DB') or None
+# Reconstruction-error threshold written by calibrate_threshold.py
+ALERT_THRESHOLD_PATH = os.environ.get('UBA_ALERT_THRESHOLD_FILE', ALERT_THRESHOLD_FILENAME)
+# Per-user thresholds: an event alerts above its user's USER_ALERT_QUANTILE
+# of reconstruction error, once the user has USER_MIN_EVENTS scored events.
+# Until then the global threshold applies.
+USER_THRESHOLDS = os.environ.get('UBA_USER_THRESHOLDS', '1') == '1'
+USER_ALERT_QUANTILE = float(os.environ.get('UBA_USER_ALERT_QUANTILE', '0.99'))
+USER_MIN_EVENTS = int(os.environ.get('UBA_USER_MIN_EVENTS', '100'))
+# Per-user error sketches, seeded by user_thresholds.py and checkpointed here
+USER_SKETCH_PATH = os.environ.get('UBA_USER_SKETCHES', SKETCH_FILENAME)
+SKETCH_CHECKPOINT_SECONDS = float(os.environ.get('UBA_SKETCH_CHECKPOINT_SECONDS', '60'))
+
+@asynccontextmanager
+async def lifespan(app):
+    broadcaster.start()
+    predict_batcher.start()
+    checkpointer = asyncio.create_task(checkpoint_user_sketches()) if USER_THRESHOLDS else None
+    yield
+    await predict_batcher.stop()
+    if checkpointer is not None:
+        checkpointer.cancel()
+        # One last checkpoint with everything the batcher has scored
+        user_sketches.save(USER_SKETCH_PATH)
 
 # --- 1. Initialize FastAPI App ---
 app = FastAPI(
     title="Guardian UBA API",
-    description="API for Real-time Insider Threat Detection"
+    description="API for Real-time Insider Threat Detection",
+    lifespan=lifespan,
 )
 templates = Jinja2Templates(directory="templates")
 
@@ -26,36 +88,234 @@ app.add_middleware(
 # --- 2. Load Your BEST Model (The Autoencoder) ---
 print("Loading the Autoencoder model and components...")
 try:
-    autoencoder_model = load_model('final_autoencoder_model.h5')
-    scaler = joblib.load('data_scaler.joblib')
-    # Pre-fit an encoder on the full dataset to handle all possible categories
-    df_full = pd.read_csv('final_labeled_dataset-modified.csv', low_memory=False)
-    event_type_encoder = {
-        label: index
-        for index, label in enumerate(pd.factorize(df_full['event_type'].fillna('missing'))[1])
-    }
-    print("✅ Autoencoder model loaded successfully.")
-except FileNotFoundError as e:
+    if INFERENCE_ENGINE == 'numpy':
+        from numpy_autoencoder import NumpyAutoencoder
+        autoencoder_model = NumpyAutoencoder.load('autoencoder_weights.npz')
+    else:
+        from tensorflow.keras.models import load_model
+        autoencoder_model = load_model('final_autoencoder_model.h5')
+    # Category vocabularies, feature order and scaler parameters from training
+    feature_schema = FeatureSchema.load('feature_schema.json')
+    # The calibrated threshold, or the 0.01 default before any calibration
+    ALERT_THRESHOLD = load_alert_threshold(ALERT_THRESHOLD_PATH)
+    user_sketches = UserErrorSketches.load(USER_SKETCH_PATH) if os.path.exists(USER_SKETCH_PATH) else UserErrorSketches()
+    print(f"✅ Autoencoder model loaded successfully ({INFERENCE_ENGINE} engine).")
+    print(f"Alert threshold: {ALERT_THRESHOLD:.6g}")
+    if USER_THRESHOLDS:
+        print(f"Per-user thresholds at the {USER_ALERT_QUANTILE} quantile, {len(user_sketches)} users seeded.")
+except (FileNotFoundError, ValueError) as e:
     print(f"🚨 Error loading model files: {e}")
     exit()
 
 # --- In-Memory Storage ---
-alerts = []
+alert_store = AlertStore(max_in_memory=ALERT_BUFFER_SIZE, db_path=ALERT_DB_PATH)
+daily_activity = DailyActivityCounter(retention_days=ACTIVITY_RETENTION_DAYS)
+# Per-user sliding windows, identical to window_features.compute_window_features
+window_state = WindowFeatureState()
+
+dashboard_stats = DashboardAggregator(threshold=ALERT_THRESHOLD)
+broadcaster = Broadcaster()
+
+# Tags event URLs with the same keyword categories the labelers use
+url_matcher = KeywordMatcher(URL_KEYWORD_CATEGORIES)
+
+# Opened on the first drill-down, so startup never touches event content
+content_store = None
+
+# --- Metrics for /metrics ---
+metrics = MetricsRegistry()
+stage_latency = metrics.histogram(
+    'uba_stage_duration_seconds', 'Time spent in each stage of the scoring path.', label='stage')
+batch_sizes = metrics.histogram(
+    'uba_batch_size', 'Events per model call.', buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256, 1024, 4096, 16384))
+events_scored = metrics.counter('uba_events_scored_total', 'Events scored by the model.')
+alerts_raised = metrics.counter('uba_alerts_total', 'Alerts raised.')
+scoring_errors = metrics.counter('uba_errors_total', 'Rejected request bodies and failed scoring calls.')
+url_category_events = {
+    category: metrics.counter(f'uba_url_{category}_events_total', f"Scored events with a '{category}' URL keyword.")
+    for category in URL_KEYWORD_CATEGORIES
+}
+
+# Fields every event must carry; null values are allowed and scored as missing
+REQUIRED_EVENT_FIELDS = ('user_id', 'timestamp', 'event_type')
 
 # --- Helper function for data preparation ---
 def prepare_features(df_new):
-    df_new['timestamp'] = pd.to_datetime(df_new['timestamp'])
+    with stage_latency.time('to_datetime'):
+        # Unparseable timestamps become NaT instead of failing the batch
+        df_new['timestamp'] = pd.to_datetime(df_new['timestamp'], errors='coerce')
     df_new['logon_hour'] = df_new['timestamp'].dt.hour
-    df_new['user_daily_activity_count'] = 1  # Placeholder for real-time
-    df_new['event_type_encoded'] = (
-        df_new['event_type']
-        .fillna('missing')
-        .map(event_type_encoder)
-        .fillna(-1)
-        .astype(int)
+    # Running count of the user's events so far that day, as in training
+    df_new['user_daily_activity_count'] = daily_activity.increment_many(
+        df_new['user_id'].fillna('missing').to_numpy(),
+        df_new['timestamp'].dt.date.to_numpy(),
     )
+    with stage_latency.time('window_features'):
+        window = window_state.update_many(
+            df_new['user_id'],
+            df_new['timestamp'],
+            df_new.get('hostname'),
+            df_new.get('event_type'),
+            df_new.get('activity'),
+        )
+    for index, col in enumerate(WINDOW_FEATURES):
+        df_new[col] = window[:, index]
     return df_new
 
+def validate_event(record):
+    """
+    Rejects an event that cannot be scored, before it touches any state.
+    Events are flat JSON objects with the REQUIRED_EVENT_FIELDS: every field
+    a string, number, bool or null.
+    """
+    if not isinstance(record, dict):
+        raise ValueError("Every event must be a JSON object.")
+    missing = [key for key in REQUIRED_EVENT_FIELDS if key not in record]
+    if missing:
+        raise ValueError(f"Missing required fields: {', '.join(missing)}.")
+    for key, value in record.items():
+        if value is not None and not isinstance(value, (str, int, float, bool)):
+            raise ValueError(f"Field '{key}' must be a string, number, boolean or null.")
+
+def parse_event_batch(body):
+    """Parses a JSON array or NDJSON request body into a list of event dicts."""
+    with stage_latency.time('parse'):
+        try:
+            text = body.decode('utf-8').strip()
+            if text.startswith('['):
+                records = json.loads(text)
+            else:
+                records = [json.loads(line) for line in text.splitlines() if line.strip()]
+        except (UnicodeDecodeError, json.JSONDecodeError) as e:
+            scoring_errors.inc()
+            raise HTTPException(status_code=400, detail=f"Invalid event batch: {e}")
+        try:
+            for record in records:
+                validate_event(record)
+        except ValueError as e:
+            scoring_errors.inc()
+            raise HTTPException(status_code=400, detail=str(e))
+    return records
+
+def run_after_wait(submitted, fn, *args):
+    """Runs `fn` on an executor thread, recording how long it queued for one."""
+    stage_latency.observe(time.perf_counter() - submitted, 'executor_wait')
+    return fn(*args)
+
+def format_alert(alert):
+    """Converts a stored alert to the format the dashboard renders."""
+    # Scored against the threshold the alert crossed
+    threshold = alert.get("threshold", ALERT_THRESHOLD)
+    return {
+        "level": alert_level(risk_score(alert["reconstruction_error"], threshold)),
+        "user": alert["user_id"],
+        "message": alert["activity"],
+        "event_id": alert.get("event_id"),
+        "categories": alert.get("url_categories", []),
+    }
+
+def alert_thresholds(user_ids, losses):
+    """
+    Each event's alert threshold: its user's high quantile of past errors,
+    or the global threshold for users without enough history. The batch's
+    own errors are recorded afterwards, so they never raise their own bar.
+    """
+    if not USER_THRESHOLDS:
+        return np.full(len(losses), ALERT_THRESHOLD)
+    thresholds = user_sketches.quantiles(user_ids, USER_ALERT_QUANTILE, min_count=USER_MIN_EVENTS)
+    user_sketches.add_many(user_ids, losses)
+    return np.where(np.isnan(thresholds), ALERT_THRESHOLD, thresholds)
+
+async def checkpoint_user_sketches():
+    """Saves the per-user sketches every SKETCH_CHECKPOINT_SECONDS."""
+    loop = asyncio.get_running_loop()
+    while True:
+        await asyncio.sleep(SKETCH_CHECKPOINT_SECONDS)
+        await loop.run_in_executor(None, user_sketches.save, USER_SKETCH_PATH)
+
+def score_events(records):
+    """
+    Runs a list of events through the Autoencoder in one vectorized pass,
+    records an alert for every anomalous event and returns the per-event
+    reconstruction errors together with the alert flags. It runs on the
+    inference threads, so the shared state it updates is lock-protected.
+    """
+    try:
+        with stage_latency.time('prepare_features'):
+            df_features = prepare_features(pd.DataFrame(records))
+        with stage_latency.time('encode'):
+            X_new = feature_schema.build_matrix(df_features)
+        with stage_latency.time('scale'):
+            X_scaled = feature_schema.transform(X_new)
+
+        # One model call for the whole batch instead of one per event
+        with stage_latency.time('predict'):
+            reconstruction = autoencoder_model.predict_on_batch(X_scaled)
+        with stage_latency.time('mse'):
+            losses = np.mean(np.square(np.asarray(reconstruction) - X_scaled), axis=1)
+        with stage_latency.time('url_keywords'):
+            url_masks = url_matcher.match([data.get("url") for data in records])
+    except Exception:
+        scoring_errors.inc()
+        raise
+    batch_sizes.observe(len(records))
+    events_scored.inc(len(records))
+    for category, counter in url_category_events.items():
+        matches = int(np.count_nonzero(url_masks & np.uint64(url_matcher.bit(category))))
+        if matches:
+            counter.inc(matches)
+
+    with stage_latency.time('user_thresholds'):
+        thresholds = alert_thresholds(df_features['user_id'].fillna('missing').to_numpy(), losses)
+    is_alert = losses > thresholds
+    new_alerts = []
+    for index in np.flatnonzero(is_alert):
+        data = records[index]
+        new_alerts.append({
+            # Normalized so the alert store can filter on it as a string
+            "timestamp": str(df_features['timestamp'].iloc[index]),
+            "user_id": data.get("user_id"),
+            # Reference into the content store for drill-down
+            "event_id": data.get("id"),
+            "activity": f"{data.get('event_type')}: {data.get('url') or data.get('filename', 'N/A')}",
+            "reconstruction_error": float(losses[index]),
+            "threshold": float(thresholds[index]),
+            "url_categories": url_matcher.category_names(url_masks[index]),
+        })
+    alerts_raised.inc(len(new_alerts))
+    alert_store.add_many(new_alerts)
+    # Plain strings, so numeric ids neither tie-break in the top-K heap nor
+    # reach the dashboard JSON as numpy scalars
+    dashboard_stats.update(
+        df_features['event_type'].fillna('missing').astype(str).to_numpy(),
+        df_features['user_id'].fillna('missing').astype(str).to_numpy(),
+        losses,
+        is_alert,
+    )
+
+    # Push the new alerts and the updated aggregates to open dashboards
+    for alert in new_alerts:
+        broadcaster.publish("alert", format_alert(alert))
+    broadcaster.publish("stats", dashboard_stats.snapshot())
+    return losses, is_alert
+
+def score_event_list(records):
+    """Batch function for the micro-batcher: one (loss, is_alert) per event."""
+    losses, is_alert = score_events(records)
+    return list(zip(losses, is_alert))
+
+inference_executor = ThreadPoolExecutor(
+    max_workers=INFERENCE_WORKERS,
+    thread_name_prefix='inference',
+)
+predict_batcher = MicroBatcher(
+    score_event_list,
+    max_batch_size=BATCH_MAX_SIZE,
+    max_wait_ms=BATCH_MAX_WAIT_MS,
+    executor=inference_executor,
+    max_concurrent_batches=INFERENCE_WORKERS,
+)
+
 # --- API Endpoints ---
 @app.get("/")
 def read_root(request: Request):
@@ -63,61 +323,133 @@ def read_root(request: Request):
 
 @app.post("/predict")
 async def predict(request: Request):
-    data = await request.json()
-    df_new = pd.DataFrame([data])
-    df_features = prepare_features(df_new)
-
-    # Use the same feature set as in training
-    feature_columns = ['event_type_encoded', 'logon_hour', 'user_daily_activity_count']
-    X_new = df_features[feature_columns]
-    X_scaled = scaler.transform(X_new)
-
-    # Make prediction using the Autoencoder
-    reconstruction = autoencoder_model.predict(X_scaled)
-    loss = tf.keras.losses.mse(reconstruction, X_scaled)
-
-    # This threshold was determined during model evaluation
-    if loss[0] > 0.01:
-        alert = {
-            "timestamp": data.get("timestamp"),
-            "user_id": data.get("user_id"),
-            "activity": f"{data.get('event_type')}: {data.get('url') or data.get('filename', 'N/A')}"
-        }
-        alerts.append(alert)
-
+    try:
+        with stage_latency.time('parse'):
+            data = await request.json()
+    except (UnicodeDecodeError, json.JSONDecodeError) as e:
+        scoring_errors.inc()
+        raise HTTPException(status_code=400, detail=f"Invalid event: {e}")
+    try:
+        validate_event(data)
+    except ValueError as e:
+        scoring_errors.inc()
+        raise HTTPException(status_code=400, detail=f"Invalid event: {e}")
+    # Concurrent single-event calls share one model call via the batcher
+    await predict_batcher.submit(data)
     return {"status": "processed"}
 
+@app.post("/predict_batch")
+async def predict_batch(request: Request):
+    """
+    Scores many events in one vectorized pass. The body can be a JSON array
+    of events or NDJSON (one event per line).
+    """
+    loop = asyncio.get_running_loop()
+    body = await request.body()
+    # Parsing is timed on the executor thread; waiting for one is 'executor_wait'
+    records = await loop.run_in_executor(
+        inference_executor, run_after_wait, time.perf_counter(), parse_event_batch, body)
+    if not records:
+        return {"status": "processed", "count": 0, "alerts": 0, "results": []}
+
+    losses, is_alert = await loop.run_in_executor(
+        inference_executor, run_after_wait, time.perf_counter(), score_events, records)
+    results = [
+        # Events without a timestamp have no error; JSON has no NaN
+        {"reconstruction_error": float(loss) if np.isfinite(loss) else None, "is_alert": bool(flag)}
+        for loss, flag in zip(losses, is_alert)
+    ]
+    return {
+        "status": "processed",
+        "count": len(records),
+        "alerts": int(is_alert.sum()),
+        "results": results,
+    }
+
+def normalize_timestamp(value, name):
+    if value is None:
+        return None
+    try:
+        return str(pd.Timestamp(value))
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid '{name}' timestamp: {value}")
+
+@app.get("/metrics")
+def get_metrics():
+    """Stage latency histograms and event/alert/error counters for Prometheus."""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
 @app.get("/get_alerts")
-def get_alerts():
-    return alerts
+def get_alerts(
+    user_id: Optional[str] = None,
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+    cursor: Optional[int] = None,
+    limit: int = Query(100, ge=1, le=1000),
+):
+    """
+    Alerts newest first, optionally filtered by user and time range. Pass
+    `next_cursor` from the response as `cursor` to fetch the next page.
+    """
+    page, next_cursor = alert_store.query(
+        user_id=user_id,
+        since=normalize_timestamp(since, 'since'),
+        until=normalize_timestamp(until, 'until'),
+        cursor=cursor,
+        limit=limit,
+    )
+    return {"alerts": page, "next_cursor": next_cursor}
+
+@app.get("/api/content/{event_id}")
+def get_event_content(event_id: str):
+    """The full `content` text of one event, for drilling into an alert."""
+    global content_store
+    if content_store is None:
+        try:
+            content_store = ContentStore(CONTENT_STORE)
+        except FileNotFoundError:
+            raise HTTPException(status_code=404, detail="No content store found. Run combine_cert_data.py first.")
+    content = content_store.get(event_id)
+    if content is None:
+        raise HTTPException(status_code=404, detail=f"No content for event {event_id}")
+    return {"event_id": event_id, "content": content}
 
 @app.get("/api/dashboard")
 def get_dashboard():
-    # Example stats (can later compute dynamically)
-    stats = {
-        "User Logins": 2847,
-        "File Access Events": 18392,
-        "Command Executions": 5421,
-        "Risk Score Avg": 42,
-    }
+    # Stats and high-risk users are kept up to date as events are scored
+    snapshot = dashboard_stats.snapshot()
 
     # Convert alerts to frontend-friendly format
-    formatted_alerts = []
-    for a in alerts[-10:]:  # last 10 alerts only
-        formatted_alerts.append({
-            "level": "medium",  # TODO: compute severity from loss score
-            "user": a["user_id"],
-            "message": a["activity"],
-        })
-
-    # Dummy high-risk users (replace with real logic later)
-    high_risk_users = [
-        {"name": "John Doe", "department": "Marketing", "score": 87},
-        {"name": "Sarah Smith", "department": "Finance", "score": 73},
-    ]
+    formatted_alerts = [format_alert(a) for a in alert_store.recent(10)]  # last 10 alerts only
 
     return {
-        "stats": stats,
+        "stats": snapshot["stats"],
         "alerts": formatted_alerts,
-        "high_risk_users": high_risk_users,
+        "high_risk_users": snapshot["high_risk_users"],
     }
+
+@app.get("/api/stream")
+async def stream_dashboard():
+    """
+    Server-Sent Events stream of new alerts ('alert' events) and updated
+    stats and high-risk users ('stats' events), pushed as events are scored.
+    """
+    queue = broadcaster.subscribe()
+
+    async def event_stream():
+        try:
+            # Start every connection from the current state
+            yield Broadcaster.format_event("stats", dashboard_stats.snapshot())
+            while True:
+                try:
+                    yield await asyncio.wait_for(queue.get(), STREAM_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+        finally:
+            broadcaster.unsubscribe(queue)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache"},
+    )
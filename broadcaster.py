@@ -0,0 +1,47 @@
+import asyncio
+import json
+
+
+class Broadcaster:
+    """
+    Fans Server-Sent Events out to every connected dashboard. Each message is
+    serialized once and the same string is queued for every subscriber,
+    however many screens are open.
+
+    `publish` may be called from any thread; delivery always happens on the
+    event loop the broadcaster was started on. A subscriber that falls more
+    than `queue_size` messages behind loses its oldest messages rather than
+    holding up everyone else.
+    """
+
+    def __init__(self, queue_size=100):
+        self.queue_size = queue_size
+        self._subscribers = set()
+        self._loop = None
+
+    def start(self):
+        self._loop = asyncio.get_running_loop()
+
+    def subscribe(self):
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        self._subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue):
+        self._subscribers.discard(queue)
+
+    @staticmethod
+    def format_event(event, data):
+        return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+    def publish(self, event, data):
+        if self._loop is None or not self._subscribers:
+            return
+        message = self.format_event(event, data)
+        self._loop.call_soon_threadsafe(self._fan_out, message)
+
+    def _fan_out(self, message):
+        for queue in list(self._subscribers):
+            if queue.full():
+                queue.get_nowait()
+            queue.put_nowait(message)
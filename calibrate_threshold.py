@@ -0,0 +1,201 @@
+import argparse
+import json
+import os
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+# Written by this script and loaded by app.py at startup
+ALERT_THRESHOLD_FILENAME = 'alert_threshold.json'
+CURVE_FILENAME = 'threshold_curve.csv'
+# What app.py uses when no calibration has been run
+DEFAULT_ALERT_THRESHOLD = 0.01
+THRESHOLD_VERSION = 1
+
+# Events per model call while scoring the labeled set
+SCORING_BATCH_SIZE = 65536
+
+
+def load_alert_threshold(filename=ALERT_THRESHOLD_FILENAME, default=DEFAULT_ALERT_THRESHOLD):
+    """The calibrated reconstruction-error threshold, or `default` if there is none."""
+    if not os.path.exists(filename):
+        return default
+    with open(filename) as f:
+        data = json.load(f)
+    if data.get('version') != THRESHOLD_VERSION:
+        raise ValueError(
+            f"Alert threshold '{filename}' has version {data.get('version')}, "
+            f"expected {THRESHOLD_VERSION}. Please re-run calibrate_threshold.py."
+        )
+    return float(data['threshold'])
+
+
+def threshold_curve(errors, y_true):
+    """
+    Precision, recall and alert rate of every distinct threshold, from one
+    sort. Ranked by descending error, the alerts of a threshold are a prefix
+    of the ranking, so cumulative sums of the labels give the true and false
+    positives of all thresholds at once. Row k alerts on exactly the events
+    with error > threshold; the first row is the threshold with no alerts.
+    """
+    errors = np.asarray(errors, dtype=np.float64)
+    y_true = np.asarray(y_true, dtype=np.int64)
+    order = np.argsort(-errors, kind='stable')
+    ranked = errors[order]
+    true_positives = np.cumsum(y_true[order])
+
+    # Ties alert together, so a threshold can only cut after a tie group
+    cuts = np.flatnonzero(np.append(ranked[1:] != ranked[:-1], True))
+    alerts = np.concatenate(([0], cuts + 1))
+    tp = np.concatenate(([0], true_positives[cuts]))
+    # The next error down from the last alerted one, which itself stays out
+    thresholds = np.concatenate(([ranked[0]], ranked[cuts[:-1] + 1], [np.nextafter(ranked[-1], -np.inf)]))
+
+    positives = int(y_true.sum())
+    with np.errstate(divide='ignore', invalid='ignore'):
+        precision = np.where(alerts > 0, tp / np.maximum(alerts, 1), 1.0)
+        recall = tp / positives if positives else np.full(len(alerts), np.nan)
+        f1 = np.where(precision + recall > 0, 2 * precision * recall / (precision + recall), 0.0)
+    return pd.DataFrame({
+        'threshold': thresholds,
+        'alerts': alerts,
+        'true_positives': tp,
+        'false_positives': alerts - tp,
+        'precision': precision,
+        'recall': recall,
+        'f1': f1,
+        'alert_rate': alerts / len(errors),
+    })
+
+
+def choose_threshold(curve, target_recall=None, max_alert_rate=None):
+    """
+    Picks one row of the curve: the highest threshold that reaches
+    `target_recall`, the one with the best recall within `max_alert_rate`,
+    or otherwise the one with the best F1.
+    """
+    if target_recall is not None:
+        candidates = curve[curve['recall'] >= target_recall]
+        objective = f'recall>={target_recall}'
+        if candidates.empty:
+            raise ValueError(f"No threshold reaches a recall of {target_recall}.")
+        return candidates.iloc[0], objective
+    if max_alert_rate is not None:
+        candidates = curve[curve['alert_rate'] <= max_alert_rate]
+        objective = f'alert_rate<={max_alert_rate}'
+        # Lowest threshold within the budget, so recall is as high as it can be
+        return candidates.iloc[-1], objective
+    if curve['recall'].isna().all():
+        raise ValueError("The labeled data has no malicious events; use --max-alert-rate instead.")
+    # idxmax keeps the first, i.e. highest, threshold among equal F1 scores
+    return curve.loc[curve['f1'].idxmax()], 'f1'
+
+
+def score_labeled_events(engine='keras'):
+    """
+    Reconstruction errors of every labeled event, computed the way app.py
+    computes them: the same model, feature schema and scaling.
+    """
+    # Imported here, so app.py can load the threshold without the training stack
+    from feature_cache import open_feature_cache
+    from feature_schema import FeatureSchema
+
+    if engine == 'numpy':
+        from numpy_autoencoder import NumpyAutoencoder
+        model = NumpyAutoencoder.load('autoencoder_weights.npz')
+    else:
+        from tensorflow.keras.models import load_model
+        model = load_model('final_autoencoder_model.h5', compile=False)
+    schema = FeatureSchema.load('feature_schema.json')
+
+    features = open_feature_cache()
+    columns, encoders = {}, {}
+    for name in features.manifest['feature_sets']:
+        for col in features.columns(name):
+            columns[col] = name
+        encoders.update(features.encoders(name))
+
+    # Cache codes are re-coded to the schema's vocabularies, in case the
+    # model was trained on a different version of the labeled data
+    recoded = schema.code_maps(encoders)
+    matrices = {name: features.matrix(name) for name in set(columns[col] for col in schema.feature_columns)}
+    positions = {col: features.columns(columns[col]).index(col) for col in schema.feature_columns}
+
+    errors = np.empty(features.manifest['rows'])
+    for start in range(0, len(errors), SCORING_BATCH_SIZE):
+        stop = start + SCORING_BATCH_SIZE
+        X = np.column_stack([
+            np.asarray(matrices[columns[col]][start:stop, positions[col]], dtype=np.float64)
+            for col in schema.feature_columns
+        ])
+        for j, col in enumerate(schema.feature_columns):
+            if col in recoded:
+                X[:, j] = recoded[col][X[:, j].astype(np.int64)]
+        X_scaled = schema.transform(X)
+        reconstruction = np.asarray(model.predict_on_batch(X_scaled))
+        errors[start:stop] = np.mean(np.square(reconstruction - X_scaled), axis=1)
+    return errors, np.asarray(features.labels), features.manifest
+
+
+def calibrate_threshold(engine='keras', target_recall=None, max_alert_rate=None,
+                        output=ALERT_THRESHOLD_FILENAME, curve_output=CURVE_FILENAME):
+    """
+    Scores the labeled set once, writes the full threshold sweep to
+    `curve_output` and the chosen threshold to `output`.
+    """
+    # --- 1. Score the Labeled Events Once ---
+    print(f"Scoring the labeled events ({engine} engine)...")
+    errors, y_true, manifest = score_labeled_events(engine)
+    print(f"Scored {len(errors)} events ({int(y_true.sum())} malicious).")
+
+    # --- 2. Sweep All Thresholds in One Pass ---
+    curve = threshold_curve(errors, y_true)
+    curve.to_csv(curve_output, index=False)
+    print(f"Precision/recall curve over {len(curve)} thresholds written to '{curve_output}'.")
+
+    # --- 3. Choose and Save the Threshold ---
+    chosen, objective = choose_threshold(curve, target_recall, max_alert_rate)
+    result = {
+        'version': THRESHOLD_VERSION,
+        'threshold': float(chosen['threshold']),
+        'objective': objective,
+        'precision': float(chosen['precision']),
+        'recall': None if pd.isna(chosen['recall']) else float(chosen['recall']),
+        'f1': float(chosen['f1']),
+        'alert_rate': float(chosen['alert_rate']),
+        'engine': engine,
+        'source': manifest['source'],
+        'rows': manifest['rows'],
+        'created_at': datetime.now(timezone.utc).isoformat(),
+    }
+    with open(output, 'w') as f:
+        json.dump(result, f, indent=2)
+
+    print(f"\nChosen threshold ({objective}): {result['threshold']:.6g}")
+    print(f"Precision {result['precision']:.3f}, recall {chosen['recall']:.3f}, "
+          f"alert rate {result['alert_rate']:.3f}")
+    print(f"Saved to '{output}'; app.py loads it at startup.")
+    return result
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Calibrate the Autoencoder's alert threshold on the labeled data.")
+    parser.add_argument('--engine', choices=['keras', 'numpy'], default='keras',
+                        help="Score with final_autoencoder_model.h5 or the exported NumPy weights.")
+    objective = parser.add_mutually_exclusive_group()
+    objective.add_argument('--target-recall', type=float,
+                           help="Use the highest threshold that reaches this recall.")
+    objective.add_argument('--max-alert-rate', type=float,
+                           help="Use the best recall that alerts on at most this fraction of events.")
+    parser.add_argument('--output', default=ALERT_THRESHOLD_FILENAME, help="Where to write the threshold.")
+    parser.add_argument('--curve', default=CURVE_FILENAME, help="Where to write the threshold sweep.")
+    args = parser.parse_args()
+
+    try:
+        calibrate_threshold(args.engine, args.target_recall, args.max_alert_rate, args.output, args.curve)
+    except FileNotFoundError as e:
+        print(f"Error: {e}")
+        print("Please train the Autoencoder and label the CERT data first.")
+    except ValueError as e:
+        print(f"Error: {e}")
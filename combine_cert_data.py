@@ -1,5 +1,37 @@
 import pandas as pd
+import argparse
+import csv
+import glob
+import heapq
 import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+from content_store import CONTENT_STORE, ContentStoreWriter, merge_content_stores, split_content
+from event_store import COMBINED_EVENTS_STORE, write_event_store
+
+# Raw CERT columns and the names used everywhere else in the pipeline
+COLUMN_RENAMES = {
+    'date': 'timestamp',
+    'user': 'user_id',
+    'pc': 'hostname'
+}
+
+# Timestamp layout of the raw '-modified' files, e.g. '01-02-2010 07:21'
+CERT_TIMESTAMP_FORMAT = '%m-%d-%Y %H:%M'
+
+# How many sorted runs the streaming merge keeps open at the same time
+MAX_OPEN_RUNS = 64
+
+# Order of the combined log
+SORT_COLUMNS = ['timestamp', 'user_id']
+# Tie-breaker carried by the sorted runs: (source, shard, row) as one
+# zero-padded string, so events with equal sort keys keep the order they
+# have in the in-memory combine. It is dropped from the merged output.
+ORDER_COLUMN = 'merge_order'
+
+# Raw CERT sources, named by their event type
+CERT_SOURCES = ['logon', 'device', 'file', 'https']
 
 def combine_modified_cert_logs():
     """
@@ -28,22 +60,26 @@ def combine_modified_cert_logs():
             print(f"Error: The file '{filename}' was not found.")
             print("Please make sure you have renamed your files correctly before running this script.")
             return # Stop the script if a file is missing
+
+    # The long free-text 'content' column goes to a side store keyed by
+    # event id, so the combined log only carries the id as a reference.
+    with ContentStoreWriter() as content_writer:
+        for filename in files_to_combine:
+            print(f"Loading and processing {filename}...")
+            
+            df = pd.read_csv(filename)
+            
+            # We can still get the base event type from the filename
+            event_type = filename.replace('-modified.csv', '')
+            df['event_type'] = event_type
             
-        print(f"Loading and processing {filename}...")
-        
-        df = pd.read_csv(filename)
-        
-        # We can still get the base event type from the filename
-        event_type = filename.replace('-modified.csv', '')
-        df['event_type'] = event_type
-        
-        df.rename(columns={
-            'date': 'timestamp',
-            'user': 'user_id',
-            'pc': 'hostname'
-        }, inplace=True)
-
-        all_dataframes.append(df)
+            df.rename(columns={
+                'date': 'timestamp',
+                'user': 'user_id',
+                'pc': 'hostname'
+            }, inplace=True)
+
+            all_dataframes.append(split_content(df, content_writer))
 
     if not all_dataframes:
         print("Error: No data was loaded.")
@@ -55,14 +91,245 @@ def combine_modified_cert_logs():
     combined_df['timestamp'] = pd.to_datetime(combined_df['timestamp'])
     
     print("Sorting all events by date and time...")
-    combined_df.sort_values(by=['timestamp', 'user_id'], inplace=True)
+    # Stable, so ties keep the file and row order of the concatenation
+    combined_df.sort_values(by=['timestamp', 'user_id'], kind='mergesort', inplace=True)
     
     print(f"Saving the combined data to '{output_filename}'...")
     combined_df.to_csv(output_filename, index=False)
     
+    print(f"Saving the columnar event store to '{COMBINED_EVENTS_STORE}'...")
+    write_event_store(combined_df, COMBINED_EVENTS_STORE)
+    
     print(f"\nProcess complete! Master log file saved as '{output_filename}'.")
+    print(f"Event content saved separately to '{CONTENT_STORE}'.")
     print(f"Total events combined: {len(combined_df)}")
 
 
+def prepare_cert_chunk(df, event_type):
+    """Renames the raw CERT columns, tags the event type and parses timestamps."""
+    df = df.rename(columns=COLUMN_RENAMES)
+    df['event_type'] = event_type
+    df['timestamp'] = pd.to_datetime(df['timestamp'], format=CERT_TIMESTAMP_FORMAT)
+    return df
+
+def merge_sorted_runs(run_paths, output_path, key_columns, drop_columns=()):
+    """
+    K-way merges CSV files that are each sorted by `key_columns` into one
+    sorted CSV, leaving out `drop_columns`. Only one row per input file is
+    held in memory at a time.
+    """
+    files = [open(path, newline='') for path in run_paths]
+    try:
+        readers = [csv.reader(f) for f in files]
+        header = None
+        for reader in readers:
+            header = next(reader)
+        key_indexes = [header.index(col) for col in key_columns]
+        # Empty (missing) values sort last, as they do in pandas
+        merged = heapq.merge(*readers, key=lambda row: [(row[i] == '', row[i]) for i in key_indexes])
+        keep = [i for i, col in enumerate(header) if col not in drop_columns]
+        with open(output_path, 'w', newline='') as out:
+            # '\n' like pandas' to_csv, so every mode writes the same bytes
+            writer = csv.writer(out, lineterminator='\n')
+            writer.writerow([header[i] for i in keep])
+            writer.writerows([row[i] for i in keep] for row in merged)
+    finally:
+        for f in files:
+            f.close()
+
+def combined_output_columns(filenames):
+    """
+    The columns of the combined log, in the order pd.concat would produce
+    them. 'content' goes to the content store instead.
+    """
+    output_columns = []
+    for filename in filenames:
+        header = pd.read_csv(filename, nrows=0).rename(columns=COLUMN_RENAMES).columns
+        for col in list(header) + ['event_type']:
+            if col not in output_columns and col != 'content':
+                output_columns.append(col)
+    return output_columns
+
+def write_sorted_run(chunk, run_path, output_columns, source_index, shard_index):
+    """
+    Sorts one prepared chunk by (timestamp, user_id) and writes it as a run,
+    tagged with each row's (source, shard, row) tie-breaker. The chunk's
+    index must be the row number within its shard, as read_csv gives it.
+    """
+    chunk = chunk.reindex(columns=output_columns)
+    chunk[ORDER_COLUMN] = [f'{source_index:03d}-{shard_index:06d}-{row:012d}' for row in chunk.index]
+    chunk = chunk.sort_values(by=SORT_COLUMNS + [ORDER_COLUMN], kind='mergesort')
+    # ISO strings sort in time order, so the merge can compare text
+    chunk['timestamp'] = chunk['timestamp'].dt.strftime('%Y-%m-%d %H:%M:%S')
+    chunk.to_csv(run_path, index=False)
+    return len(chunk)
+
+def merge_runs_into(run_paths, run_dir, output_filename):
+    """Merges sorted runs into the output, in groups when there are many."""
+    while len(run_paths) > MAX_OPEN_RUNS:
+        print(f"Merging {len(run_paths)} sorted runs in groups of {MAX_OPEN_RUNS}...")
+        merged_paths = []
+        for start in range(0, len(run_paths), MAX_OPEN_RUNS):
+            merged_path = os.path.join(run_dir, f'merged-{len(merged_paths)}-{len(run_paths)}.csv')
+            merge_sorted_runs(run_paths[start:start + MAX_OPEN_RUNS], merged_path, SORT_COLUMNS + [ORDER_COLUMN])
+            merged_paths.append(merged_path)
+        run_paths = merged_paths
+
+    print(f"Merging {len(run_paths)} sorted runs into '{output_filename}'...")
+    merge_sorted_runs(run_paths, output_filename, SORT_COLUMNS + [ORDER_COLUMN], drop_columns=[ORDER_COLUMN])
+
+def write_event_store_from_csv(filename, chunksize):
+    """Writes the columnar event store from a combined log, chunk by chunk."""
+    # The merged file is time-sorted, so each chunk lands in few partitions
+    print(f"Saving the columnar event store to '{COMBINED_EVENTS_STORE}'...")
+    for i, chunk in enumerate(pd.read_csv(filename, chunksize=chunksize)):
+        write_event_store(chunk, COMBINED_EVENTS_STORE, append=i > 0)
+
+def combine_modified_cert_logs_streaming(chunksize=100000):
+    """
+    Out-of-core version of combine_modified_cert_logs() for full CERT
+    releases. Each source file is read `chunksize` rows at a time, every
+    chunk is sorted on its own and written to a temporary run file, and the
+    runs are then k-way merged by (timestamp, user_id) into the output.
+    Peak memory depends on the chunk size, not on the dataset size.
+    """
+    files_to_combine = [
+        'logon-modified.csv',
+        'device-modified.csv',
+        'file-modified.csv',
+        'https-modified.csv'
+    ]
+    output_filename = 'combined_log-final.csv'
+
+    print("Starting the streaming data combination process...")
+
+    for filename in files_to_combine:
+        if not os.path.exists(filename):
+            print(f"Error: The file '{filename}' was not found.")
+            print("Please make sure you have renamed your files correctly before running this script.")
+            return
+
+    output_columns = combined_output_columns(files_to_combine)
+
+    total_events = 0
+    with tempfile.TemporaryDirectory(prefix='combine-runs-', dir='.') as run_dir, \
+            ContentStoreWriter() as content_writer:
+        # --- 1. Write Sorted Runs ---
+        run_paths = []
+        for source_index, filename in enumerate(files_to_combine):
+            event_type = filename.replace('-modified.csv', '')
+            print(f"Sorting {filename} in chunks of {chunksize} rows...")
+            for chunk in pd.read_csv(filename, chunksize=chunksize):
+                chunk = prepare_cert_chunk(chunk, event_type)
+                chunk = split_content(chunk, content_writer)
+                run_path = os.path.join(run_dir, f'run-{len(run_paths)}.csv')
+                total_events += write_sorted_run(chunk, run_path, output_columns, source_index, 0)
+                run_paths.append(run_path)
+
+        # --- 2. Merge the Runs ---
+        # With very many runs, merge them in groups first so the number of
+        # open files stays bounded.
+        merge_runs_into(run_paths, run_dir, output_filename)
+
+    write_event_store_from_csv(output_filename, chunksize)
+
+    print(f"\nProcess complete! Master log file saved as '{output_filename}'.")
+    print(f"Event content saved separately to '{CONTENT_STORE}'.")
+    print(f"Total events combined: {total_events}")
+
+
+def find_shards(input_dir):
+    """
+    The shard files of every CERT source under `input_dir`, as
+    (event_type, path) pairs. A source's shards are either named
+    '<source>-*.csv' (e.g. 'logon-modified.csv', 'logon-0001.csv') or are
+    the CSV files in a '<source>/' folder.
+    """
+    shards = []
+    for event_type in CERT_SOURCES:
+        paths = glob.glob(os.path.join(input_dir, f'{event_type}-*.csv'))
+        paths += glob.glob(os.path.join(input_dir, event_type, '*.csv'))
+        shards += [(event_type, path) for path in sorted(paths)]
+    return shards
+
+def ingest_shard(task):
+    """
+    Process-pool worker: parses one shard into sorted runs. Its content
+    goes to a content store part of its own, merged by the parent later.
+    """
+    shard_index, event_type, path, run_dir, content_root, output_columns, chunksize = task
+    run_paths = []
+    events = 0
+    with ContentStoreWriter(content_root) as content_writer:
+        for chunk in pd.read_csv(path, chunksize=chunksize):
+            chunk = prepare_cert_chunk(chunk, event_type)
+            chunk = split_content(chunk, content_writer)
+            run_path = os.path.join(run_dir, f'shard-{shard_index}-run-{len(run_paths)}.csv')
+            events += write_sorted_run(chunk, run_path, output_columns, CERT_SOURCES.index(event_type), shard_index)
+            run_paths.append(run_path)
+    return run_paths, events
+
+def combine_cert_shards_parallel(input_dir='.', workers=None, chunksize=100000):
+    """
+    Parallel version of combine_modified_cert_logs_streaming() for sources
+    that arrive as many shard files. A process pool parses shards concurrently
+    (column renames, explicit-format timestamps, content split-off and
+    sorting into runs), and the runs are then k-way merged into the same
+    combined log and event store as the other modes.
+    """
+    output_filename = 'combined_log-final.csv'
+    workers = workers or os.cpu_count() or 1
+
+    print(f"Starting the parallel data combination process with {workers} workers...")
+
+    shards = find_shards(input_dir)
+    missing = [source for source in CERT_SOURCES if source not in {event_type for event_type, _ in shards}]
+    if missing:
+        print(f"Error: No shards found in '{input_dir}' for: {', '.join(missing)}")
+        return
+    print(f"Found {len(shards)} shards.")
+
+    output_columns = combined_output_columns([path for _, path in shards])
+
+    with tempfile.TemporaryDirectory(prefix='combine-runs-', dir='.') as run_dir:
+        # --- 1. Parse Shards in Parallel ---
+        tasks = [
+            (i, event_type, path, run_dir, os.path.join(run_dir, f'content-{i}'), output_columns, chunksize)
+            for i, (event_type, path) in enumerate(shards)
+        ]
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(ingest_shard, tasks))
+        run_paths = [run_path for shard_runs, _ in results for run_path in shard_runs]
+        total_events = sum(events for _, events in results)
+
+        # --- 2. Merge Runs and Content ---
+        merge_runs_into(run_paths, run_dir, output_filename)
+        merge_content_stores([task[4] for task in tasks], CONTENT_STORE)
+
+    write_event_store_from_csv(output_filename, chunksize)
+
+    print(f"\nProcess complete! Master log file saved as '{output_filename}'.")
+    print(f"Event content saved separately to '{CONTENT_STORE}'.")
+    print(f"Total events combined: {total_events}")
+
+
 if __name__ == '__main__':
-    combine_modified_cert_logs()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Combine the CERT log files into one time-sorted event log.")
+    parser.add_argument('--streaming', action='store_true',
+                        help="Sort in chunks and k-way merge, for logs that do not fit in memory.")
+    parser.add_argument('--parallel', action='store_true',
+                        help="Parse sharded sources concurrently with a process pool.")
+    parser.add_argument('--input-dir', default='.',
+                        help="Where to look for shards in parallel mode.")
+    parser.add_argument('--workers', type=int, default=None,
+                        help="Worker processes in parallel mode (default: one per CPU).")
+    parser.add_argument('--chunksize', type=int, default=100000,
+                        help="Rows per chunk in streaming and parallel mode.")
+    args = parser.parse_args()
+
+    if args.parallel:
+        combine_cert_shards_parallel(input_dir=args.input_dir, workers=args.workers, chunksize=args.chunksize)
+    elif args.streaming:
+        combine_modified_cert_logs_streaming(chunksize=args.chunksize)
+    else:
+        combine_modified_cert_logs()
\ No newline at end of file
@@ -0,0 +1,181 @@
+import heapq
+import mmap
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+# Written by combine_cert_data.py next to the combined log
+CONTENT_STORE = 'content_store'
+
+BLOB_FILENAME = 'content.blob'
+# One (id, offset, length) record per event with content, sorted by id
+INDEX_FILENAME = 'content_index.npy'
+INDEX_RUNS_DIRNAME = 'index_runs'
+
+# How many sorted index runs a merge reads from at the same time
+MAX_OPEN_INDEX_RUNS = 64
+# Index records read from each run at a time, and written to the output
+# at a time, while merging
+INDEX_READ_BLOCK = 4096
+INDEX_WRITE_BLOCK = 65536
+
+
+def index_dtype(id_width):
+    return np.dtype([('id', f'U{max(id_width, 1)}'), ('offset', np.int64), ('length', np.int64)])
+
+
+def merge_index_runs(run_paths, output_path, bases=None):
+    """
+    K-way merges index files that are each sorted by id into one sorted
+    index, adding `bases[i]` to the offsets of run i. The runs are memory-
+    mapped and the output is written block by block, so memory does not
+    grow with the number of records. Equal ids keep the order of the runs.
+    """
+    bases = list(bases) if bases is not None else [0] * len(run_paths)
+    runs = [np.load(path, mmap_mode='r') for path in run_paths]
+    total = sum(len(run) for run in runs)
+    width = max((run.dtype['id'].itemsize // 4 for run in runs), default=1)
+    output = np.lib.format.open_memmap(output_path, mode='w+', dtype=index_dtype(width), shape=(total,))
+
+    def records(run, base):
+        for start in range(0, len(run), INDEX_READ_BLOCK):
+            block = run[start:start + INDEX_READ_BLOCK]
+            yield from zip(block['id'].tolist(), (block['offset'] + base).tolist(), block['length'].tolist())
+
+    merged = heapq.merge(*(records(run, base) for run, base in zip(runs, bases)), key=lambda record: record[0])
+    position = 0
+    while position < total:
+        block = [record for _, record in zip(range(INDEX_WRITE_BLOCK), merged)]
+        output[position:position + len(block)] = block
+        position += len(block)
+    output.flush()
+    del output, runs
+
+
+def merge_index_runs_into(run_paths, output_path, run_dir, bases=None):
+    """Merges index runs into `output_path`, in groups when there are many."""
+    bases = list(bases) if bases is not None else [0] * len(run_paths)
+    level = 0
+    while len(run_paths) > MAX_OPEN_INDEX_RUNS:
+        merged_paths = []
+        for start in range(0, len(run_paths), MAX_OPEN_INDEX_RUNS):
+            merged_path = os.path.join(run_dir, f'merged-{level}-{len(merged_paths)}.npy')
+            merge_index_runs(run_paths[start:start + MAX_OPEN_INDEX_RUNS], merged_path,
+                             bases[start:start + MAX_OPEN_INDEX_RUNS])
+            merged_paths.append(merged_path)
+        run_paths, bases = merged_paths, [0] * len(merged_paths)
+        level += 1
+    merge_index_runs(run_paths, output_path, bases)
+
+
+class ContentStoreWriter:
+    """
+    Writes the bulky `content` text of file and http events to a side store
+    keyed by event id: one blob file with all texts back to back, and an
+    index of (id, offset, length) sorted by id. Use it as a context manager
+    and call `add` once per chunk of events.
+
+    Each chunk's index entries are sorted and written as a run of their
+    own, and the runs are merged on close, so memory depends on the chunk
+    size rather than on the number of events.
+    """
+
+    def __init__(self, root=CONTENT_STORE):
+        self.root = root
+        self._run_dir = os.path.join(root, INDEX_RUNS_DIRNAME)
+        self._run_paths = []
+        self._offset = 0
+        self._blob = None
+
+    def __enter__(self):
+        os.makedirs(self._run_dir, exist_ok=True)
+        self._blob = open(os.path.join(self.root, BLOB_FILENAME), 'wb')
+        return self
+
+    def add(self, ids, contents):
+        """Stores the non-empty contents of one chunk of events."""
+        entries = []
+        for event_id, content in zip(ids, contents):
+            if pd.isna(content) or content == '':
+                continue
+            data = str(content).encode('utf-8')
+            self._blob.write(data)
+            entries.append((str(event_id), self._offset, len(data)))
+            self._offset += len(data)
+        if not entries:
+            return
+        run = np.array(entries, dtype=index_dtype(max(len(entry[0]) for entry in entries)))
+        run_path = os.path.join(self._run_dir, f'run-{len(self._run_paths)}.npy')
+        np.save(run_path, run[np.argsort(run['id'], kind='stable')])
+        self._run_paths.append(run_path)
+
+    def __exit__(self, exc_type, exc, tb):
+        self._blob.close()
+        try:
+            merge_index_runs_into(self._run_paths, os.path.join(self.root, INDEX_FILENAME), self._run_dir)
+        finally:
+            shutil.rmtree(self._run_dir, ignore_errors=True)
+        return False
+
+
+def split_content(df, writer):
+    """Moves `content` out of an event frame into the side store."""
+    if 'content' not in df.columns:
+        return df
+    writer.add(df['id'], df['content'])
+    return df.drop(columns=['content'])
+
+
+def merge_content_stores(part_roots, root=CONTENT_STORE):
+    """
+    Combines content stores written in parallel into one: the blobs are
+    appended in order and the sorted part indexes merged, with offsets
+    shifted to match.
+    """
+    run_dir = os.path.join(root, INDEX_RUNS_DIRNAME)
+    os.makedirs(run_dir, exist_ok=True)
+    bases = []
+    with open(os.path.join(root, BLOB_FILENAME), 'wb') as blob:
+        for part_root in part_roots:
+            bases.append(blob.tell())
+            with open(os.path.join(part_root, BLOB_FILENAME), 'rb') as part:
+                shutil.copyfileobj(part, blob)
+    try:
+        merge_index_runs_into([os.path.join(part_root, INDEX_FILENAME) for part_root in part_roots],
+                              os.path.join(root, INDEX_FILENAME), run_dir, bases)
+    finally:
+        shutil.rmtree(run_dir, ignore_errors=True)
+
+
+class ContentStore:
+    """
+    Read side of the content store. The blob is memory-mapped and lookups
+    binary-search the sorted id index, so opening the store costs nothing
+    up front and each lookup only touches the bytes it returns.
+    """
+
+    def __init__(self, root=CONTENT_STORE):
+        # Contiguous columns, which searchsorted can use without a copy
+        index = np.load(os.path.join(root, INDEX_FILENAME), mmap_mode='r')
+        self._ids = np.ascontiguousarray(index['id'])
+        self._offsets = np.ascontiguousarray(index['offset'])
+        self._lengths = np.ascontiguousarray(index['length'])
+        del index
+        self._file = open(os.path.join(root, BLOB_FILENAME), 'rb')
+        # mmap cannot map an empty file
+        self._blob = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if self._lengths.size else b''
+
+    def get(self, event_id):
+        """The content of an event, or None if it has none."""
+        position = np.searchsorted(self._ids, event_id)
+        if position == len(self._ids) or self._ids[position] != event_id:
+            return None
+        offset = self._offsets[position]
+        return self._blob[offset:offset + self._lengths[position]].decode('utf-8')
+
+    def close(self):
+        if isinstance(self._blob, mmap.mmap):
+            self._blob.close()
+        self._file.close()
@@ -1,6 +1,47 @@
 import pandas as pd
 import os
 
+from event_store import COMBINED_EVENTS_STORE, LABELED_EVENTS_STORE, load_events, write_event_store
+
+def merge_scenario_windows(df_answers):
+    """
+    Collapses the answer key into non-overlapping (user_id, start, end)
+    windows: scenarios of the same user that overlap or touch are merged.
+    """
+    windows = df_answers[['user_id', 'start', 'end']].sort_values(['user_id', 'start'])
+    # A window opens a new group when it starts after every earlier window
+    # of the same user has ended.
+    latest_end = windows.groupby('user_id')['end'].cummax()
+    previous_end = latest_end.groupby(windows['user_id']).shift()
+    group = (previous_end.isna() | (windows['start'] > previous_end)).cumsum()
+    return windows.groupby(group).agg(
+        user_id=('user_id', 'first'), start=('start', 'first'), end=('end', 'max'))
+
+def label_events_in_windows(df_logs, windows):
+    """
+    1 for each event whose user has a window with start <= timestamp <= end,
+    0 otherwise, aligned with `df_logs`. Events are sorted once and each is
+    matched to the last window of its user starting at or before it, so the
+    cost does not grow with the number of scenarios. Events without a
+    timestamp are never in a window and stay 0.
+    """
+    events = pd.DataFrame({
+        'user_id': df_logs['user_id'].astype(str).to_numpy(),
+        'timestamp': df_logs['timestamp'].to_numpy(),
+        'position': range(len(df_logs)),
+    })
+    # merge_asof refuses null keys
+    events = events[events['timestamp'].notna()].sort_values('timestamp', kind='stable')
+    windows = windows.dropna(subset=['start', 'end'])
+    windows = windows.assign(user_id=windows['user_id'].astype(str)).sort_values('start')
+    matched = pd.merge_asof(
+        events, windows, left_on='timestamp', right_on='start', by='user_id', direction='backward')
+    in_window = (matched['timestamp'] <= matched['end']).to_numpy()
+
+    labels = pd.Series(0, index=df_logs.index)
+    labels.iloc[matched['position'].to_numpy()[in_window]] = 1
+    return labels
+
 def label_cert_data():
     """
     This function reads the combined log file and the answers file
@@ -18,12 +59,13 @@ def label_cert_data():
 
     # --- Main Script ---
     # Check if input files exist
-    if not os.path.exists(combined_log_filename) or not os.path.exists(answers_filename):
+    has_combined_logs = os.path.isdir(COMBINED_EVENTS_STORE) or os.path.exists(combined_log_filename)
+    if not has_combined_logs or not os.path.exists(answers_filename):
         print(f"Error: Make sure both '{combined_log_filename}' and '{answers_filename}' exist in your folder.")
         return
 
     print(f"Loading combined log data from '{combined_log_filename}'...")
-    df_logs = pd.read_csv(combined_log_filename)
+    df_logs = load_events(COMBINED_EVENTS_STORE, combined_log_filename)
     
     print(f"Loading insider threat answers from '{answers_filename}'...")
     df_answers = pd.read_csv(answers_filename)
@@ -33,31 +75,20 @@ def label_cert_data():
     df_answers['start'] = pd.to_datetime(df_answers['start'])
     df_answers['end'] = pd.to_datetime(df_answers['end'])
 
-    # Initialize the new 'is_malicious' label column to 0 (normal)
-    print("Creating 'is_malicious' label column...")
-    df_logs['is_malicious'] = 0
-
-    # Iterate through each malicious scenario to label the events
+    # Join every event against its user's malicious time windows in one pass;
+    # everything outside them is labeled 0 (normal)
     print("Tagging malicious events based on the answers file...")
-    for index, row in df_answers.iterrows():
-        user = row['user_id']
-        start_time = row['start']
-        end_time = row['end']
-        
-        # Find all log entries that match the user AND fall within the malicious time window
-        malicious_events_mask = (
-            (df_logs['user_id'] == user) &
-            (df_logs['timestamp'] >= start_time) &
-            (df_logs['timestamp'] <= end_time)
-        )
-        
-        # Set the 'is_malicious' label for these events to 1
-        df_logs.loc[malicious_events_mask, 'is_malicious'] = 1
-        print(f"  - Labeled {malicious_events_mask.sum()} events for user '{user}'.")
+    windows = merge_scenario_windows(df_answers)
+    df_logs['is_malicious'] = label_events_in_windows(df_logs, windows)
+
+    labeled_users = df_logs.loc[df_logs['is_malicious'] == 1, 'user_id'].astype(object).value_counts()
+    for user in df_answers['user_id'].unique():
+        print(f"  - Labeled {labeled_users.get(user, 0)} events for user '{user}'.")
 
     # Save the final labeled dataset
     print(f"\nSaving the fully labeled test data to '{output_filename}'...")
     df_logs.to_csv(output_filename, index=False)
+    write_event_store(df_logs, LABELED_EVENTS_STORE)
     
     print("\nProcess complete!")
     print(f"Your final test file is ready: '{output_filename}'")
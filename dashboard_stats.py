@@ -0,0 +1,132 @@
+import heapq
+import threading
+from collections import deque
+
+# Dashboard card for each event type (CERT http logs arrive as 'https')
+EVENT_TYPE_LABELS = {
+    'logon': 'User Logins',
+    'file': 'File Access Events',
+    'device': 'Device Connections',
+    'http': 'Web Requests',
+    'https': 'Web Requests',
+}
+
+
+def risk_score(error, threshold):
+    """
+    Maps a reconstruction error onto a 0-100 risk score: 50 at the alert
+    threshold, approaching 100 as the error grows.
+    """
+    return 100.0 * error / (error + threshold) if error > 0 else 0.0
+
+
+def alert_level(score):
+    if score >= 80:
+        return "high"
+    if score >= 65:
+        return "medium"
+    return "low"
+
+
+class DashboardAggregator:
+    """
+    Live dashboard state, updated as events are scored: a counter per event
+    type, the mean risk score over the last `window` events and the `top_k`
+    users with the highest peak risk score.
+
+    Each event costs O(1) for the counters and the rolling mean and
+    O(log top_k) for the top-K heap, and `snapshot()` only reads this state,
+    so the dashboard never rescans events or alerts.
+    """
+
+    def __init__(self, threshold, top_k=5, window=1000):
+        self.threshold = threshold
+        self.top_k = top_k
+        self._lock = threading.Lock()
+        self._event_counts = {}
+        self._events_scored = 0
+        self._alerts_raised = 0
+        self._risk_window = deque(maxlen=window)
+        self._risk_sum = 0.0
+        # Peak risk and alert count per user. A user's peak only ever grows,
+        # which is what lets the top-K heap be maintained incrementally.
+        self._peak_risk = {}
+        self._user_alerts = {}
+        # Members of the top-K and a min-heap of (score, insertion order,
+        # user) over them; the insertion order breaks ties between equal
+        # scores, so user ids are never compared. Heap entries whose score
+        # no longer matches `_top` are stale and skipped lazily.
+        self._top = {}
+        self._heap = []
+        self._pushes = 0
+
+    def update(self, event_types, user_ids, losses, is_alert):
+        """Adds one scored batch of events to the aggregates."""
+        with self._lock:
+            for event_type, user_id, loss, flag in zip(event_types, user_ids, losses, is_alert):
+                self._event_counts[event_type] = self._event_counts.get(event_type, 0) + 1
+                self._events_scored += 1
+
+                score = risk_score(float(loss), self.threshold)
+                if len(self._risk_window) == self._risk_window.maxlen:
+                    self._risk_sum -= self._risk_window[0]
+                self._risk_window.append(score)
+                self._risk_sum += score
+
+                if flag:
+                    self._alerts_raised += 1
+                    self._user_alerts[user_id] = self._user_alerts.get(user_id, 0) + 1
+                self._offer(user_id, score)
+
+    def _discard_stale(self):
+        while self._heap and self._top.get(self._heap[0][2]) != self._heap[0][0]:
+            heapq.heappop(self._heap)
+
+    def _entry(self, user_id, score):
+        self._pushes += 1
+        return (score, self._pushes, user_id)
+
+    def _offer(self, user_id, score):
+        if score <= self._peak_risk.get(user_id, -1.0):
+            return
+        self._peak_risk[user_id] = score
+
+        if user_id in self._top or len(self._top) < self.top_k:
+            self._top[user_id] = score
+            heapq.heappush(self._heap, self._entry(user_id, score))
+            # Raised scores leave stale entries behind; rebuild before the
+            # heap grows past twice its live size so pushes stay O(log K).
+            if len(self._heap) > 2 * self.top_k:
+                self._heap = [self._entry(u, s) for u, s in self._top.items()]
+                heapq.heapify(self._heap)
+            return
+
+        self._discard_stale()
+        lowest_score, _, lowest_user = self._heap[0]
+        if score > lowest_score:
+            heapq.heapreplace(self._heap, self._entry(user_id, score))
+            del self._top[lowest_user]
+            self._top[user_id] = score
+
+    def snapshot(self):
+        """Current stats and high-risk users, in the /api/dashboard format."""
+        with self._lock:
+            stats = {}
+            for event_type, count in self._event_counts.items():
+                label = EVENT_TYPE_LABELS.get(event_type, 'Other Events')
+                stats[label] = stats.get(label, 0) + count
+            stats["Events Scored"] = self._events_scored
+            stats["Alerts Raised"] = self._alerts_raised
+            window_size = len(self._risk_window)
+            stats["Risk Score Avg"] = round(self._risk_sum / window_size) if window_size else 0
+
+            high_risk_users = [
+                {
+                    "name": user_id,
+                    "department": "Unknown",
+                    "score": round(score),
+                    "alerts": self._user_alerts.get(user_id, 0),
+                }
+                for user_id, score in sorted(self._top.items(), key=lambda item: -item[1])
+            ]
+        return {"stats": stats, "high_risk_users": high_risk_users}
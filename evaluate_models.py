@@ -0,0 +1,232 @@
+import argparse
+import glob
+import json
+import os
+import time
+from datetime import datetime, timezone
+
+import joblib
+import numpy as np
+import pandas as pd
+from sklearn.metrics import confusion_matrix, precision_recall_fscore_support
+
+from calibrate_threshold import load_alert_threshold
+from feature_cache import FEATURE_CACHE, open_feature_cache
+from feature_schema import FeatureSchema, schema_path
+
+# Every saved model the harness looks for, in report order
+MODEL_PATTERNS = [
+    'insider_threat_model.joblib',
+    'final_cert_model*.joblib',
+    'final_autoencoder_model*.h5',
+    'autoencoder_weights.npz',
+]
+# Feature schema of the Autoencoder from train_autoencoder.py, and of its NumPy export
+DEFAULT_SCHEMA = 'feature_schema.json'
+
+BENCHMARK_BATCH_SIZES = [1, 64, 1024, 8192]
+# Batches timed per batch size, after one untimed warm-up batch
+BENCHMARK_BATCHES = 200
+
+RESULTS_FILENAME = 'evaluation_results.json'
+
+
+def recode(X, code_maps):
+    """
+    A copy of `X` with the feature cache's category codes mapped onto the
+    codes a model was trained with (unseen categories get the schema's -1).
+    """
+    X = X.astype(np.float64)
+    for col, code_map in code_maps.items():
+        X[col] = code_map[X[col].to_numpy(dtype=np.int64)]
+    return X
+
+
+class IsolationForestScorer:
+    """Inputs are recoded through the model's FeatureSchema, as for the Autoencoders."""
+
+    def __init__(self, model, schema, cache_encoders):
+        self.model = model
+        self.kind = 'isolation_forest'
+        self.columns = list(schema.feature_columns)
+        self._code_maps = schema.code_maps(cache_encoders)
+
+    def predict(self, X):
+        # IsolationForest marks anomalies as -1
+        return self.model.predict(recode(X, self._code_maps)) == -1
+
+
+class AutoencoderScorer:
+    """
+    Flags events whose reconstruction error is above the app's threshold.
+    Inputs go through the model's own FeatureSchema, as in app.py: the
+    feature cache's category codes are mapped onto the vocabularies the
+    model was trained with (unseen categories get the schema's -1), then
+    scaled with the training scaler parameters.
+    """
+
+    def __init__(self, model, schema, kind, threshold, cache_encoders):
+        self.model = model
+        self.schema = schema
+        self.kind = kind
+        self.threshold = threshold
+        self.columns = list(schema.feature_columns)
+        self._code_maps = schema.code_maps(cache_encoders)
+
+    def predict(self, X):
+        X_scaled = self.schema.transform(recode(X, self._code_maps).to_numpy())
+        reconstruction = np.asarray(self.model.predict_on_batch(X_scaled))
+        return np.mean(np.square(X_scaled - reconstruction), axis=1) > self.threshold
+
+
+def find_artifacts(patterns=MODEL_PATTERNS):
+    found = []
+    for pattern in patterns:
+        for path in sorted(glob.glob(pattern)):
+            if path not in found:
+                found.append(path)
+    return found
+
+
+def load_scorer(path, threshold, cache_encoders):
+    """A scorer for one artifact, by file type."""
+    if path.endswith('.joblib'):
+        # Without the encoders it was trained with, its category codes would
+        # not mean the same as the cache's, so the model is not comparable
+        if not os.path.exists(schema_path(path)):
+            raise FileNotFoundError(
+                f"no feature schema '{schema_path(path)}'; retrain the model to compare it")
+        return IsolationForestScorer(joblib.load(path), FeatureSchema.load(schema_path(path)), cache_encoders)
+
+    # A tuned model from sweep.py carries its own schema
+    schema = FeatureSchema.load(schema_path(path) if os.path.exists(schema_path(path)) else DEFAULT_SCHEMA)
+    if path.endswith('.npz'):
+        from numpy_autoencoder import NumpyAutoencoder
+        return AutoencoderScorer(NumpyAutoencoder.load(path), schema, 'numpy_autoencoder', threshold, cache_encoders)
+    from tensorflow.keras.models import load_model
+    return AutoencoderScorer(load_model(path, compile=False), schema, 'keras_autoencoder', threshold,
+                             cache_encoders)
+
+
+def detection_metrics(y_true, predicted_labels):
+    precision, recall, f1, _ = precision_recall_fscore_support(
+        y_true, predicted_labels, average='binary', zero_division=0)
+    tn, fp, fn, tp = confusion_matrix(y_true, predicted_labels, labels=[0, 1]).ravel()
+    return {
+        'precision': float(precision),
+        'recall': float(recall),
+        'f1': float(f1),
+        'alert_rate': float(np.mean(predicted_labels)),
+        'true_positives': int(tp),
+        'false_positives': int(fp),
+        'false_negatives': int(fn),
+        'true_negatives': int(tn),
+    }
+
+
+def benchmark(scorer, X, batch_sizes=BENCHMARK_BATCH_SIZES, batches=BENCHMARK_BATCHES):
+    """
+    Scoring latency and throughput per batch size. Consecutive batches
+    walk through the data, wrapping around, so every call sees new rows.
+    """
+    results = []
+    for batch_size in batch_sizes:
+        batch_size = min(batch_size, len(X))
+        starts = (np.arange(batches + 1) * batch_size) % max(len(X) - batch_size + 1, 1)
+        scorer.predict(X.iloc[starts[0]:starts[0] + batch_size])
+
+        latencies = np.empty(batches)
+        for i, start in enumerate(starts[1:]):
+            batch = X.iloc[start:start + batch_size]
+            started = time.perf_counter()
+            scorer.predict(batch)
+            latencies[i] = time.perf_counter() - started
+        results.append({
+            'batch_size': int(batch_size),
+            'batches': batches,
+            'events_per_second': float(batch_size * batches / latencies.sum()),
+            'p50_ms': float(np.percentile(latencies, 50) * 1000),
+            'p99_ms': float(np.percentile(latencies, 99) * 1000),
+        })
+    return results
+
+
+def evaluate_models(artifacts=None, cache_root=FEATURE_CACHE, output=RESULTS_FILENAME,
+                    batch_sizes=BENCHMARK_BATCH_SIZES, batches=BENCHMARK_BATCHES):
+    """
+    Scores every saved model on the same feature cache and writes
+    precision/recall and the scoring benchmark of each one to `output`.
+    """
+    # --- 1. Load the Shared Features ---
+    features = open_feature_cache(cache_root)
+    all_features = pd.concat(
+        [features.frame(name) for name in features.manifest['feature_sets']], axis=1)
+    cache_encoders = {}
+    for name in features.manifest['feature_sets']:
+        cache_encoders.update(features.encoders(name))
+    y_true = np.asarray(features.labels)
+    # Autoencoders alert at the threshold app.py serves with
+    threshold = load_alert_threshold()
+    print(f"Evaluating on {len(y_true)} events ({int(y_true.sum())} malicious) from '{features.manifest['source']}'.")
+
+    report = {
+        'created_at': datetime.now(timezone.utc).isoformat(),
+        'feature_cache': {
+            'source': features.manifest['source'],
+            'rows': features.manifest['rows'],
+            'source_signature': features.manifest['source_signature'],
+        },
+        'alert_threshold': threshold,
+        'models': [],
+    }
+
+    for path in artifacts or find_artifacts():
+        # --- 2. Load the Model and Its Features ---
+        try:
+            scorer = load_scorer(path, threshold, cache_encoders)
+        except (FileNotFoundError, KeyError, ValueError, AttributeError) as e:
+            print(f"Skipping '{path}': {e}")
+            report['models'].append({'artifact': path, 'error': str(e)})
+            continue
+        missing = [col for col in scorer.columns if col not in all_features.columns]
+        if missing:
+            print(f"Skipping '{path}': features {missing} are not in the feature cache.")
+            report['models'].append({'artifact': path, 'error': f"missing features {missing}"})
+            continue
+        X = all_features[scorer.columns]
+
+        # --- 3. Detection Quality and Scoring Speed ---
+        print(f"\n--- {path} ({scorer.kind}) ---")
+        result = {'artifact': path, 'kind': scorer.kind, 'features': scorer.columns}
+        result.update(detection_metrics(y_true, scorer.predict(X)))
+        result['benchmark'] = benchmark(scorer, X, batch_sizes, batches)
+        report['models'].append(result)
+
+        print(f"Precision {result['precision']:.3f}, recall {result['recall']:.3f}, "
+              f"F1 {result['f1']:.3f}, alert rate {result['alert_rate']:.3f}")
+        for run in result['benchmark']:
+            print(f"  batch {run['batch_size']:>5}: {run['events_per_second']:>12,.0f} events/s, "
+                  f"p50 {run['p50_ms']:.3f} ms, p99 {run['p99_ms']:.3f} ms")
+
+    # --- 4. Save the Report ---
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"\nEvaluation results written to '{output}'.")
+    return report
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Evaluate and benchmark every saved model on the feature cache.")
+    parser.add_argument('artifacts', nargs='*', help="Model files to evaluate (default: every saved model).")
+    parser.add_argument('--cache', default=FEATURE_CACHE, help="Feature cache directory.")
+    parser.add_argument('--output', default=RESULTS_FILENAME, help="Where to write the JSON results.")
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=BENCHMARK_BATCH_SIZES,
+                        help="Batch sizes to benchmark.")
+    parser.add_argument('--batches', type=int, default=BENCHMARK_BATCHES,
+                        help="Timed batches per batch size.")
+    args = parser.parse_args()
+
+    try:
+        evaluate_models(args.artifacts, args.cache, args.output, args.batch_sizes, args.batches)
+    except FileNotFoundError:
+        print("Error: labeled CERT data not found. Run one of the labeling scripts first.")
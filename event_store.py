@@ -0,0 +1,160 @@
+import os
+import re
+import shutil
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+# Stores written by the pipeline stages, next to their CSV outputs
+COMBINED_EVENTS_STORE = 'event_store/combined'
+LABELED_EVENTS_STORE = 'event_store/labeled'
+
+# Low-cardinality text columns, stored dictionary-encoded
+CATEGORICAL_COLUMNS = ['user_id', 'hostname', 'event_type', 'activity']
+
+PARTITIONING = ds.partitioning(pa.schema([('date', pa.string())]), flavor='hive')
+
+# part-<write sequence>-<file index>.parquet; files are read back in
+# (date, sequence, index) order, which is the order they were written in
+PART_FILE_PATTERN = re.compile(r'^part-(\d+)-(\d+)\.parquet$')
+
+
+def _to_arrow(df):
+    df = df.copy()
+    df['timestamp'] = pd.to_datetime(df['timestamp'])
+    for col in CATEGORICAL_COLUMNS:
+        if col in df.columns:
+            df[col] = df[col].astype('category')
+    df['date'] = df['timestamp'].dt.strftime('%Y-%m-%d')
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    # pandas picks the smallest index type per chunk; fix it so files
+    # written separately share one schema.
+    schema = pa.schema([
+        field.with_type(pa.dictionary(pa.int32(), field.type.value_type))
+        if pa.types.is_dictionary(field.type) else field
+        for field in table.schema
+    ], metadata=table.schema.metadata)
+    return table.cast(schema)
+
+
+def _part_files(root):
+    """Every Parquet file of the store as (date, sequence, index, path), in read order."""
+    files = []
+    for date in list_partitions(root):
+        folder = partition_path(root, date)
+        for name in os.listdir(folder):
+            if not name.endswith('.parquet'):
+                continue
+            # Stores written before the sequence numbers sort by name
+            match = PART_FILE_PATTERN.match(name)
+            sequence, index = (int(match.group(1)), int(match.group(2))) if match else (-1, 0)
+            files.append((date, sequence, index, os.path.join(folder, name)))
+    return sorted(files)
+
+
+def _next_sequence(root):
+    files = _part_files(root) if os.path.isdir(root) else []
+    return max((sequence for _, sequence, _, _ in files), default=-1) + 1
+
+
+def write_event_store(df, root, append=False):
+    """
+    Writes events as Parquet under `root`, one `date=YYYY-MM-DD` directory
+    per day. By default the whole store is replaced. With `append=True`,
+    `df` is added as new files next to what is already there, which lets
+    large inputs be written one chunk at a time. Every write gets the next
+    sequence number in its file names, so reads return the chunks in the
+    order they were appended.
+    """
+    if not append and os.path.exists(root):
+        shutil.rmtree(root)
+    sequence = _next_sequence(root)
+    pq.write_to_dataset(
+        _to_arrow(df),
+        root,
+        partition_cols=['date'],
+        basename_template=f'part-{sequence:06d}-{{i}}.parquet',
+        existing_data_behavior='overwrite_or_ignore',
+    )
+
+
+def list_partitions(root):
+    """The dates stored under `root`, oldest first."""
+    if not os.path.isdir(root):
+        return []
+    return sorted(name[len('date='):] for name in os.listdir(root) if name.startswith('date='))
+
+
+def partition_path(root, date):
+    return os.path.join(root, f'date={date}')
+
+
+def replace_event_partitions(df, root):
+    """
+    Rewrites only the date partitions that `df` has events for, leaving
+    every other day of the store untouched.
+    """
+    dates = pd.to_datetime(df['timestamp']).dt.strftime('%Y-%m-%d').unique()
+    for date in dates:
+        path = partition_path(root, date)
+        if os.path.exists(path):
+            shutil.rmtree(path)
+    write_event_store(df, root, append=True)
+
+
+def read_event_store(root, columns=None, start=None, end=None):
+    """
+    Reads events from a store written by `write_event_store`.
+
+    `columns` projects the read to just those columns, and `start`/`end`
+    keep events with `start <= timestamp < end`. Both are pushed down to
+    Parquet: only the needed columns are decoded, and date directories
+    outside the range are never opened. Events come back in the order they
+    were written: day by day, and within a day chunk by chunk.
+    """
+    paths = [path for _, _, _, path in _part_files(root)]
+    dataset = ds.dataset(paths, format='parquet', partitioning=PARTITIONING, partition_base_dir=root)
+    conditions = []
+    if start is not None:
+        start = pd.Timestamp(start)
+        conditions += [ds.field('date') >= start.strftime('%Y-%m-%d'), ds.field('timestamp') >= start]
+    if end is not None:
+        end = pd.Timestamp(end)
+        conditions += [ds.field('date') <= end.strftime('%Y-%m-%d'), ds.field('timestamp') < end]
+    row_filter = None
+    for condition in conditions:
+        row_filter = condition if row_filter is None else row_filter & condition
+
+    if columns is None:
+        # 'date' only exists to partition the files
+        columns = [name for name in dataset.schema.names if name != 'date']
+    table = dataset.to_table(columns=columns, filter=row_filter)
+    # Each file has its own dictionaries; unify them so pandas gets one
+    # categorical per column.
+    return table.unify_dictionaries().to_pandas()
+
+
+def load_events(store_root, csv_filename, columns=None, start=None, end=None):
+    """
+    Loads pipeline events from the columnar store when it exists, falling
+    back to the stage's CSV output otherwise.
+    """
+    if os.path.isdir(store_root):
+        return read_event_store(store_root, columns=columns, start=start, end=end)
+
+    filter_by_time = start is not None or end is not None
+    usecols = columns
+    if columns is not None and filter_by_time and 'timestamp' not in columns:
+        usecols = list(columns) + ['timestamp']
+    df = pd.read_csv(csv_filename, usecols=usecols, low_memory=False)
+    if filter_by_time:
+        timestamps = pd.to_datetime(df['timestamp'])
+        keep = pd.Series(True, index=df.index)
+        if start is not None:
+            keep &= timestamps >= pd.Timestamp(start)
+        if end is not None:
+            keep &= timestamps < pd.Timestamp(end)
+        df = df[keep]
+    return df[columns] if columns is not None else df
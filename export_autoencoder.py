@@ -0,0 +1,73 @@
+import os
+import sys
+
+import numpy as np
+from tensorflow.keras.layers import Dense, InputLayer
+from tensorflow.keras.models import load_model
+
+from numpy_autoencoder import NumpyAutoencoder
+
+def export_autoencoder_weights():
+    """
+    This script pulls the weights out of the saved Keras Autoencoder into a
+    compact .npz file for the TensorFlow-free NumPy engine, then checks that
+    both engines give the same reconstructions before keeping the export.
+    Returns False, leaving any previous export in place, if it fails.
+    """
+    model_filename = 'final_autoencoder_model.h5'
+    output_filename = 'autoencoder_weights.npz'
+    # Checked before it replaces the real file, so a bad export is never served
+    temporary_filename = f'{output_filename}.tmp'
+
+    try:
+        model = load_model(model_filename)
+    except (FileNotFoundError, OSError):
+        print(f"Error: Model file '{model_filename}' not found.")
+        print("Please run 'train_autoencoder.py' first to train and save the model.")
+        return False
+
+    # --- 1. Extract the Dense Layers ---
+    arrays = {}
+    activations = []
+    for layer in model.layers:
+        if isinstance(layer, InputLayer):
+            continue
+        if not isinstance(layer, Dense):
+            print(f"Error: Layer '{layer.name}' ({type(layer).__name__}) is not supported by the NumPy engine.")
+            return False
+        kernel, bias = layer.get_weights()
+        index = len(activations)
+        arrays[f'kernel_{index}'] = kernel.astype(np.float32)
+        arrays[f'bias_{index}'] = bias.astype(np.float32)
+        activations.append(layer.get_config()['activation'])
+
+    print(f"Exporting {len(activations)} Dense layers ({', '.join(activations)}) to '{output_filename}'...")
+    with open(temporary_filename, 'wb') as f:
+        np.savez(f, activations=np.array(activations), **arrays)
+
+    # --- 2. Parity Check Against Keras ---
+    # The scaler maps every feature into [0, 1], so random points in the unit
+    # cube (plus the corners) cover the inputs the app will send.
+    input_dim = model.input_shape[-1]
+    rng = np.random.default_rng(42)
+    corners = np.array(np.meshgrid(*[[0.0, 1.0]] * input_dim)).reshape(input_dim, -1).T
+    X_check = np.vstack([corners, rng.random((1000, input_dim))]).astype(np.float32)
+
+    keras_output = np.asarray(model.predict_on_batch(X_check))
+    numpy_output = NumpyAutoencoder.load(temporary_filename).predict_on_batch(X_check)
+    max_difference = float(np.max(np.abs(keras_output - numpy_output)))
+    print(f"Largest difference between Keras and NumPy reconstructions: {max_difference:.2e}")
+
+    if not np.allclose(keras_output, numpy_output, rtol=1e-5, atol=1e-6):
+        print("Error: The NumPy engine does not match the Keras model. The export was discarded.")
+        os.remove(temporary_filename)
+        return False
+
+    os.replace(temporary_filename, output_filename)
+    print("\nExport complete! Set UBA_INFERENCE_ENGINE=numpy to serve it from app.py.")
+    return True
+
+
+if __name__ == '__main__':
+    if not export_autoencoder_weights():
+        sys.exit(1)
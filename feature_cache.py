@@ -0,0 +1,226 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+from sklearn.preprocessing import LabelEncoder
+
+from event_store import LABELED_EVENTS_STORE, load_events
+from window_features import WINDOW_FEATURES, compute_window_features
+
+# Built from the labeled dataset, next to it
+FEATURE_CACHE = 'feature_cache'
+MANIFEST_FILENAME = 'manifest.json'
+CACHE_VERSION = 2
+
+LABELED_FILENAME = 'final_labeled_dataset-modified.csv'
+
+# Features of the Autoencoder and the advanced Isolation Forest
+BEHAVIOR_FEATURES = ["event_type", "logon_hour", "user_daily_activity_count"]
+# Features the synthetic-data model from train.py expects
+RESOURCE_FEATURES = ["action_type", "resource_accessed", "success"]
+
+
+def _fit_label_encoders(df, columns):
+    """Label-encodes `columns` of `df` in place, missing values as 'missing'."""
+    encoders = {}
+    for col in columns:
+        df[col] = df[col].astype(object).fillna('missing')
+        encoder = LabelEncoder()
+        df[col] = encoder.fit_transform(df[col].astype(str))
+        encoders[col] = encoder
+    return encoders
+
+
+def running_daily_count(user_ids, timestamps):
+    """
+    The user's number of events so far that day, counting the event itself,
+    in time order: what activity_state.DailyActivityCounter gives app.py
+    live. Events without a timestamp get NaN, as they do live.
+    """
+    timestamps = pd.to_datetime(pd.Series(timestamps).reset_index(drop=True))
+    users = pd.Series(user_ids).reset_index(drop=True).astype(object).fillna('missing')
+    # Stable, so events with equal timestamps count in input order
+    order = np.argsort(timestamps.to_numpy(), kind='mergesort')
+    ordered = pd.DataFrame({'user_id': users.to_numpy()[order], 'date': timestamps.dt.date.to_numpy()[order]})
+    counts = np.full(len(timestamps), np.nan)
+    counts[order] = ordered.groupby(['user_id', 'date'], dropna=True).cumcount().to_numpy() + 1
+    counts[timestamps.isna().to_numpy()] = np.nan
+    return counts
+
+
+def build_behavior_features(df):
+    """Event type, hour of day and the user's running event count that day."""
+    timestamps = pd.to_datetime(df['timestamp'])
+    features = pd.DataFrame({
+        'event_type': df['event_type'],
+        'logon_hour': timestamps.dt.hour,
+        'user_daily_activity_count': running_daily_count(df['user_id'], timestamps),
+    })
+    encoders = _fit_label_encoders(features, ['event_type'])
+    return features[BEHAVIOR_FEATURES].to_numpy(dtype=np.float64), encoders
+
+
+def build_resource_features(df):
+    """CERT events mapped onto the action/resource/success features of train.py."""
+    features = pd.DataFrame({
+        'action_type': df['event_type'].astype(object),
+        # Whichever of filename and url the event has
+        'resource_accessed': df['filename'].fillna(df['url']),
+        # CERT data has no success flag; one consistent placeholder value
+        'success': 'success',
+    })
+    encoders = _fit_label_encoders(features, RESOURCE_FEATURES)
+    return features[RESOURCE_FEATURES].to_numpy(dtype=np.int64), encoders
+
+
+def build_window_features(df):
+    """Per-user sliding-window counts, as app.py computes them live."""
+    features = compute_window_features(
+        df['user_id'], df['timestamp'], df['hostname'], df['event_type'], df['activity'])
+    return features, {}
+
+
+FEATURE_SETS = {
+    'behavior': (BEHAVIOR_FEATURES, build_behavior_features),
+    'resource': (RESOURCE_FEATURES, build_resource_features),
+    'window': (WINDOW_FEATURES, build_window_features),
+}
+
+
+def source_path():
+    """Where the labeled events are read from, as in `load_events`."""
+    return LABELED_EVENTS_STORE if os.path.isdir(LABELED_EVENTS_STORE) else LABELED_FILENAME
+
+
+def source_signature(path):
+    """(file, size, mtime) of everything under `path`, to detect changes."""
+    if os.path.isfile(path):
+        stat = os.stat(path)
+        return [[path, stat.st_size, stat.st_mtime_ns]]
+    signature = []
+    for folder, _, filenames in os.walk(path):
+        for filename in filenames:
+            file_path = os.path.join(folder, filename)
+            stat = os.stat(file_path)
+            signature.append([os.path.relpath(file_path, path), stat.st_size, stat.st_mtime_ns])
+    return sorted(signature)
+
+
+def _save_array(root, filename, array):
+    # A new file replaces the old one, so open memory maps stay valid
+    temporary_path = os.path.join(root, f'.{filename}.tmp')
+    with open(temporary_path, 'wb') as f:
+        np.save(f, array)
+    os.replace(temporary_path, os.path.join(root, filename))
+
+
+def build_feature_cache(root=FEATURE_CACHE):
+    """
+    Reads the labeled dataset once, builds every feature set and writes
+    them as .npy files with a JSON manifest (columns, shapes, encoder
+    vocabularies and the signature of the source data).
+    """
+    source = source_path()
+    print(f"Building the feature cache in '{root}' from '{source}'...")
+    df = load_events(LABELED_EVENTS_STORE, LABELED_FILENAME,
+                     columns=['timestamp', 'user_id', 'hostname', 'event_type', 'activity',
+                              'filename', 'url', 'is_malicious'])
+
+    os.makedirs(root, exist_ok=True)
+    manifest = {
+        'version': CACHE_VERSION,
+        'source': source,
+        'source_signature': source_signature(source),
+        'rows': len(df),
+        'labels': 'labels.npy',
+        'feature_sets': {},
+    }
+    _save_array(root, 'labels.npy', df['is_malicious'].to_numpy(dtype=np.int64))
+    for name, (columns, build) in FEATURE_SETS.items():
+        matrix, encoders = build(df)
+        filename = f'{name}.npy'
+        _save_array(root, filename, matrix)
+        manifest['feature_sets'][name] = {
+            'file': filename,
+            'columns': columns,
+            'dtype': str(matrix.dtype),
+            'shape': list(matrix.shape),
+            'vocabularies': {col: [str(c) for c in encoder.classes_] for col, encoder in encoders.items()},
+        }
+
+    # The manifest goes last: a cache is only valid once it is written
+    with open(os.path.join(root, MANIFEST_FILENAME), 'w') as f:
+        json.dump(manifest, f, indent=2)
+    print(f"Feature cache built: {len(df)} events, feature sets {', '.join(FEATURE_SETS)}.")
+    return manifest
+
+
+class FeatureCache:
+    """
+    Read side of the feature cache. Matrices and labels are opened as
+    read-only memory maps, so opening the cache copies no data.
+    """
+
+    def __init__(self, root, manifest):
+        self.root = root
+        self.manifest = manifest
+        self.labels = np.load(os.path.join(root, manifest['labels']), mmap_mode='r')
+
+    def columns(self, name):
+        return list(self.manifest['feature_sets'][name]['columns'])
+
+    def matrix(self, name):
+        """One feature set as a (rows x features) read-only memory map."""
+        entry = self.manifest['feature_sets'][name]
+        return np.load(os.path.join(self.root, entry['file']), mmap_mode='r')
+
+    def frame(self, name):
+        """The same matrix as a DataFrame with feature names, without copying."""
+        return pd.DataFrame(self.matrix(name), columns=self.columns(name), copy=False)
+
+    def encoders(self, name):
+        """The fitted LabelEncoders of a feature set, rebuilt from the manifest."""
+        encoders = {}
+        for col, classes in self.manifest['feature_sets'][name]['vocabularies'].items():
+            encoder = LabelEncoder()
+            encoder.classes_ = np.array(classes, dtype=object)
+            encoders[col] = encoder
+        return encoders
+
+
+def _is_current(manifest):
+    source = manifest.get('source')
+    return (
+        manifest.get('version') == CACHE_VERSION
+        and source == source_path()
+        and os.path.exists(source)
+        and manifest.get('source_signature') == source_signature(source)
+        and set(manifest.get('feature_sets', {})) == set(FEATURE_SETS)
+    )
+
+
+def open_feature_cache(root=FEATURE_CACHE, build=True):
+    """
+    Opens the feature cache, building it first if it is missing or the
+    labeled data changed since it was built. Raises FileNotFoundError when
+    there is no labeled data to build it from, or, with `build=False`, when
+    the cache would have to be built: building loads the whole labeled
+    dataset into memory.
+    """
+    manifest_path = os.path.join(root, MANIFEST_FILENAME)
+    manifest = None
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+    if manifest is None or not _is_current(manifest):
+        if not build:
+            raise FileNotFoundError(
+                f"The feature cache in '{root}' is missing or older than the labeled data. "
+                f"Build it with 'python feature_cache.py' first.")
+        manifest = build_feature_cache(root)
+    return FeatureCache(root, manifest)
+
+
+if __name__ == '__main__':
+    build_feature_cache()
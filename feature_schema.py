@@ -0,0 +1,123 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+SCHEMA_VERSION = 1
+
+
+class FeatureSchema:
+    """
+    Everything the live app needs to turn raw events into the Autoencoder's
+    input: the feature order, the category vocabularies of the label-encoded
+    columns and the MinMaxScaler parameters. It is written next to
+    data_scaler.joblib at training time so app.py never has to read the
+    training data. IsolationForest models get one too, without scaling, so
+    their inputs can be encoded the way they were trained.
+    """
+
+    def __init__(self, feature_columns, vocabularies, scale, min_):
+        self.feature_columns = list(feature_columns)
+        self.vocabularies = {col: list(values) for col, values in vocabularies.items()}
+        self.scale = np.asarray(scale, dtype=np.float64)
+        self.min_ = np.asarray(min_, dtype=np.float64)
+        self._codes = {
+            col: {value: code for code, value in enumerate(values)}
+            for col, values in self.vocabularies.items()
+        }
+
+    @classmethod
+    def from_training(cls, feature_columns, encoders, scaler=None):
+        """
+        Builds the schema from the fitted LabelEncoders and MinMaxScaler.
+        Without a scaler, `transform` leaves the values as they are.
+        """
+        vocabularies = {col: [str(c) for c in encoder.classes_] for col, encoder in encoders.items()}
+        if scaler is None:
+            return cls(feature_columns, vocabularies, np.ones(len(feature_columns)), np.zeros(len(feature_columns)))
+        return cls(feature_columns, vocabularies, scaler.scale_, scaler.min_)
+
+    @classmethod
+    def load(cls, filename):
+        with open(filename) as f:
+            data = json.load(f)
+        if data.get('version') != SCHEMA_VERSION:
+            raise ValueError(
+                f"Feature schema '{filename}' has version {data.get('version')}, "
+                f"expected {SCHEMA_VERSION}. Please re-run the training script."
+            )
+        return cls(data['feature_columns'], data['vocabularies'], data['scale'], data['min'])
+
+    def save(self, filename):
+        data = {
+            'version': SCHEMA_VERSION,
+            'feature_columns': self.feature_columns,
+            'vocabularies': self.vocabularies,
+            'scale': self.scale.tolist(),
+            'min': self.min_.tolist(),
+        }
+        with open(filename, 'w') as f:
+            json.dump(data, f, indent=2)
+
+    def encode(self, col, values):
+        """Label-encodes raw category values; unseen categories become -1."""
+        values = pd.Series(values).fillna('missing').astype(str)
+        return values.map(self._codes[col]).fillna(-1).to_numpy(dtype=np.float64)
+
+    def code_maps(self, encoders):
+        """
+        For each label-encoded column, an array that maps the codes of another
+        fitted LabelEncoder (e.g. the feature cache's) to this schema's codes.
+        """
+        return {
+            col: self.encode(col, encoders[col].classes_)
+            for col in self.feature_columns if col in self.vocabularies
+        }
+
+    def build_matrix(self, df):
+        """Returns the unscaled feature matrix of `df` in training column order."""
+        return np.column_stack([
+            self.encode(col, df[col]) if col in self.vocabularies
+            else df[col].to_numpy(dtype=np.float64)
+            for col in self.feature_columns
+        ])
+
+    def transform(self, X):
+        """Applies the same scaling as MinMaxScaler.transform."""
+        return X * self.scale + self.min_
+
+
+def schema_path(artifact):
+    """A model's feature schema, saved next to it."""
+    return os.path.splitext(artifact)[0] + '_schema.json'
+
+
+def build_schema_from_existing_artifacts():
+    """
+    One-off migration for models trained before the schema existed: rebuilds
+    the schema from 'data_scaler.joblib' and the labeled dataset, using the
+    same sorted LabelEncoder ordering as train_autoencoder.py.
+    """
+    import joblib
+
+    scaler_filename = 'data_scaler.joblib'
+    cert_data_filename = 'final_labeled_dataset-modified.csv'
+    output_filename = 'feature_schema.json'
+
+    try:
+        scaler = joblib.load(scaler_filename)
+        event_types = pd.read_csv(cert_data_filename, usecols=['event_type'])['event_type']
+    except FileNotFoundError as e:
+        print(f"Error: {e}")
+        return
+
+    feature_columns = ["event_type", "logon_hour", "user_daily_activity_count"]
+    vocabularies = {"event_type": sorted(event_types.fillna('missing').astype(str).unique())}
+    schema = FeatureSchema(feature_columns, vocabularies, scaler.scale_, scaler.min_)
+    schema.save(output_filename)
+    print(f"Feature schema saved to '{output_filename}'.")
+
+
+if __name__ == '__main__':
+    build_schema_from_existing_artifacts()
@@ -1,5 +1,10 @@
+import numpy as np
 import pandas as pd
 
+from event_store import COMBINED_EVENTS_STORE, LABELED_EVENTS_STORE, load_events, write_event_store
+from keyword_matcher import URL_KEYWORD_CATEGORIES, KeywordMatcher
+from user_day_cube import build_user_day_cube
+
 def find_and_label_anomalies():
     """
     This algorithm automatically hunts for suspicious patterns in the CERT data
@@ -11,7 +16,7 @@ def find_and_label_anomalies():
     print(f"--- Starting Anomaly Hunting for '{input_filename}' ---")
     
     try:
-        df = pd.read_csv(input_filename, low_memory=False)
+        df = load_events(COMBINED_EVENTS_STORE, input_filename)
     except FileNotFoundError:
         print(f"Error: Could not find '{input_filename}'. Please run the combine script first.")
         return
@@ -20,65 +25,64 @@ def find_and_label_anomalies():
     df['date'] = pd.to_datetime(df['timestamp']).dt.date
 
     # --- 2. Define Anomaly Rules and Keywords ---
-    job_search_keywords = ['job', 'career', 'resume', 'hiring']
-    leak_site_keywords = ['wikileaks']
+    # All keyword categories are matched together in one scan per URL
+    url_matcher = KeywordMatcher(URL_KEYWORD_CATEGORIES)
 
     # --- 3. Calculate Daily Activity Metrics for Each User ---
     print("Analyzing daily user activities...")
     
-    # Calculate file copies per user per day
-    daily_file_copies = df[df['event_type'] == 'file'].groupby(['user_id', 'date']).size().reset_index(name='file_copy_count')
-
-    # Find days with any USB device connection
-    daily_device_usage = df[df['event_type'] == 'device'].groupby(['user_id', 'date']).size().reset_index(name='device_connections')
-    daily_device_usage['used_usb'] = 1
+    # Find job search activity (CERT names the web log 'https')
+    is_http = df['event_type'].isin(['http', 'https']).to_numpy()
+    url_masks = np.zeros(len(df), dtype=np.uint64)
+    url_masks[is_http] = url_matcher.match(df['url'][is_http])
+    is_job_search = (url_masks & np.uint64(url_matcher.bit('job_search'))) != 0
 
-    # Find days with job search activity
-    df_http = df[df['event_type'] == 'http'].copy()
-    df_http['is_job_search'] = df_http['url'].str.contains('|'.join(job_search_keywords), na=False)
-    daily_job_searches = df_http[df_http['is_job_search']].groupby(['user_id', 'date']).size().reset_index(name='job_search_count')
-    daily_job_searches['searched_for_jobs'] = 1
+    # File copies, USB device connections and job searches per user per day,
+    # all aggregated in one pass
+    cube = build_user_day_cube(df['user_id'], df['timestamp'], {
+        'file_copy_count': df['event_type'] == 'file',
+        'device_connections': df['event_type'] == 'device',
+        'job_search_count': is_job_search,
+    })
+    file_copy_count = cube['file_copy_count']
+    used_usb = cube['device_connections'] > 0
+    searched_for_jobs = cube['job_search_count'] > 0
 
-    # --- 4. Combine Metrics and Calculate a Daily Risk Score ---
+    # --- 4. Calculate a Daily Risk Score ---
     print("Calculating daily risk scores for each user...")
     
-    # Merge all daily metrics together
-    user_daily_summary = pd.merge(daily_file_copies, daily_device_usage[['user_id', 'date', 'used_usb']], on=['user_id', 'date'], how='left')
-    user_daily_summary = pd.merge(user_daily_summary, daily_job_searches[['user_id', 'date', 'searched_for_jobs']], on=['user_id', 'date'], how='left')
-    user_daily_summary.fillna(0, inplace=True)
+    # Only user-days with file copies are scored
+    has_file_copies = file_copy_count > 0
     
     # Simple risk score: High file copies are suspicious, other actions add to the risk.
     # We define "high" as more than the average user's busiest day.
-    file_copy_threshold = user_daily_summary['file_copy_count'].quantile(0.95) # Top 5%
+    file_copy_threshold = np.quantile(file_copy_count[has_file_copies], 0.95) if has_file_copies.any() else 0 # Top 5%
     
-    user_daily_summary['risk_score'] = 0
+    risk_score = np.zeros(file_copy_count.shape, dtype=int)
     # Rule 1: High volume file copy is a major indicator
-    user_daily_summary.loc[user_daily_summary['file_copy_count'] > file_copy_threshold, 'risk_score'] += 5
+    risk_score[file_copy_count > file_copy_threshold] += 5
     # Rule 2: Using a USB adds to suspicion
-    user_daily_summary.loc[user_daily_summary['used_usb'] == 1, 'risk_score'] += 2
+    risk_score[used_usb] += 2
     # Rule 3: Searching for jobs adds to suspicion
-    user_daily_summary.loc[user_daily_summary['searched_for_jobs'] == 1, 'risk_score'] += 3
+    risk_score[searched_for_jobs] += 3
 
     # --- 5. Identify High-Risk Days and Label the Data ---
     # Find the days where the risk score is very high (e.g., score >= 8 means file copies + job search)
-    anomalous_days = user_daily_summary[user_daily_summary['risk_score'] >= 8][['user_id', 'date']]
+    anomalous_days = has_file_copies & (risk_score >= 8)
     
-    if anomalous_days.empty:
+    if not anomalous_days.any():
         print("\nWarning: No days with highly suspicious combined activity were found.")
         print("The test dataset will not have any labeled anomalies.")
     else:
-        print(f"\nFound {len(anomalous_days)} potentially anomalous user-days to label.")
+        print(f"\nFound {anomalous_days.sum()} potentially anomalous user-days to label.")
 
-    # Merge these anomaly flags back into the main dataframe
-    df = pd.merge(df, anomalous_days, on=['user_id', 'date'], how='left', indicator=True)
-    
-    # Create the final label column
-    df['is_malicious'] = (df['_merge'] == 'both').astype(int)
-    df.drop(columns=['_merge'], inplace=True)
+    # Each event reads its own user-day flag straight from the cube
+    df['is_malicious'] = (cube.per_event(anomalous_days) == 1).astype(int)
 
     # --- 6. Save the Final Labeled Dataset ---
     print(f"Saving the new labeled test data to '{output_filename}'...")
     df.to_csv(output_filename, index=False)
+    write_event_store(df.drop(columns=['date']), LABELED_EVENTS_STORE)
     
     print("\nProcess complete!")
     print(f"Total events labeled as malicious: {df['is_malicious'].sum()}")
@@ -1,6 +1,8 @@
 import pandas as pd
 import random
 
+from event_store import COMBINED_EVENTS_STORE, LABELED_EVENTS_STORE, load_events, write_event_store
+
 def inject_and_label():
     """
     This script loads the combined CERT data, injects a synthetic anomaly
@@ -13,14 +15,14 @@ def inject_and_label():
     print(f"--- Starting Anomaly Injection for '{input_filename}' ---")
     
     try:
-        df = pd.read_csv(input_filename)
+        df = load_events(COMBINED_EVENTS_STORE, input_filename)
     except FileNotFoundError:
         print(f"Error: Could not find '{input_filename}'. Please run the combine script first.")
         return
 
     # --- 1. Select a Target for the Anomaly ---
     # We choose a user who has performed at least one 'file' activity.
-    file_users = df[df['event_type'] == 'file']['user_id'].unique()
+    file_users = list(df[df['event_type'] == 'file']['user_id'].unique())
     
     if len(file_users) == 0:
         print("Error: Could not find any users with 'file' activity to create an anomaly.")
@@ -59,6 +61,7 @@ def inject_and_label():
     # --- 4. Save the Final Labeled Dataset ---
     print(f"\nSaving the new labeled test data to '{output_filename}'...")
     df.to_csv(output_filename, index=False)
+    write_event_store(df, LABELED_EVENTS_STORE)
     
     print("\nProcess complete!")
     print(f"Your final test file is ready: '{output_filename}'")
@@ -0,0 +1,111 @@
+from collections import deque
+
+import numpy as np
+import pandas as pd
+
+# URL keyword categories shared by the batch labelers and the live scorer
+URL_KEYWORD_CATEGORIES = {
+    'job_search': ['job', 'career', 'resume', 'hiring'],
+    'leak_site': ['wikileaks'],
+}
+
+# URLs matched together in one block of the vectorized scan
+MATCH_BLOCK_SIZE = 4096
+
+
+class KeywordMatcher:
+    """
+    Aho-Corasick matcher over several keyword categories at once. The
+    automaton is compiled into a dense (state x byte) transition table, so
+    scanning a text is one table lookup per byte however many keywords
+    there are. Each text is tagged with a bitmask of the categories that
+    have a keyword anywhere in it (case-sensitive, like `str.contains`).
+    """
+
+    def __init__(self, categories=URL_KEYWORD_CATEGORIES):
+        if len(categories) > 64:
+            raise ValueError("KeywordMatcher supports at most 64 categories.")
+        self.categories = list(categories)
+
+        # --- 1. Build the Trie ---
+        children = [{}]
+        outputs = [0]
+        for bit, category in enumerate(self.categories):
+            for keyword in categories[category]:
+                data = keyword.encode('utf-8')
+                if not data or 0 in data:
+                    raise ValueError(f"Invalid keyword for '{category}': {keyword!r}")
+                state = 0
+                for byte in data:
+                    if byte not in children[state]:
+                        children[state][byte] = len(children)
+                        children.append({})
+                        outputs.append(0)
+                    state = children[state][byte]
+                outputs[state] |= 1 << bit
+
+        # --- 2. Resolve Failure Links into a Full Transition Table ---
+        # Breadth-first, so a state's failure target is always complete
+        # before the state itself is filled in.
+        table = np.zeros((len(children), 256), dtype=np.int32)
+        table[0, list(children[0])] = list(children[0].values())
+        queue = deque((child, 0) for child in children[0].values())
+        while queue:
+            state, fail = queue.popleft()
+            outputs[state] |= outputs[fail]
+            table[state] = table[fail]
+            for byte, child in children[state].items():
+                table[state, byte] = child
+                queue.append((child, table[fail, byte]))
+
+        self._table = table
+        self._outputs = np.array(outputs, dtype=np.uint64)
+
+    def bit(self, category):
+        """The mask bit of one category."""
+        return 1 << self.categories.index(category)
+
+    def category_names(self, mask):
+        """The categories set in a mask, in definition order."""
+        return [category for i, category in enumerate(self.categories) if int(mask) >> i & 1]
+
+    def match_one(self, text):
+        """Category mask of a single text. Missing values match nothing."""
+        if text is None or pd.isna(text):
+            return 0
+        state, mask = 0, 0
+        for byte in str(text).encode('utf-8'):
+            state = self._table[state, byte]
+            mask |= int(self._outputs[state])
+        return mask
+
+    def match(self, texts):
+        """
+        Category masks for many texts as a uint64 array. The automaton
+        advances all texts of a block together, one byte position at a time.
+        """
+        texts = pd.Series(texts, dtype=object)
+        masks = np.zeros(len(texts), dtype=np.uint64)
+        present = np.flatnonzero(texts.notna().to_numpy())
+        if present.size == 0:
+            return masks
+
+        encoded = [str(text).encode('utf-8') for text in texts.iloc[present]]
+        lengths = np.fromiter(map(len, encoded), dtype=np.int64, count=len(encoded))
+        # Similar lengths share a block, so little padding is scanned
+        order = np.argsort(lengths, kind='stable')
+        for start in range(0, len(order), MATCH_BLOCK_SIZE):
+            block = order[start:start + MATCH_BLOCK_SIZE]
+            width = int(lengths[block].max())
+            # NUL padding leads back to the root and matches nothing
+            padded = np.zeros((len(block), width), dtype=np.uint8)
+            for row, index in enumerate(block):
+                padded[row, :lengths[index]] = np.frombuffer(encoded[index], dtype=np.uint8)
+
+            states = np.zeros(len(block), dtype=np.int32)
+            block_masks = np.zeros(len(block), dtype=np.uint64)
+            for position in range(width):
+                states = self._table[states, padded[:, position]]
+                block_masks |= self._outputs[states]
+            masks[present[block]] = block_masks
+        return masks
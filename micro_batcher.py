@@ -0,0 +1,110 @@
+import asyncio
+
+
+class MicroBatcher:
+    """
+    Collects single items submitted by concurrent requests and hands them to
+    a batch function together. A batch is flushed as soon as it holds
+    `max_batch_size` items or the first item in it has waited `max_wait_ms`.
+
+    `batch_fn` receives a list of items and must return one result per item,
+    in the same order. `batch_fn` runs on `executor` (the loop's default
+    executor if None), with at most `max_concurrent_batches` batches in
+    flight. While all of them are busy, new items keep queueing and form the
+    next, larger batch.
+
+    `batch_fn` may update shared state as it goes, so a batch that raises is
+    never retried: every item in it gets the exception. Callers should
+    validate items before submitting them, so one malformed item cannot
+    fail the others.
+    """
+
+    def __init__(self, batch_fn, max_batch_size=64, max_wait_ms=5.0,
+                 executor=None, max_concurrent_batches=1):
+        self.batch_fn = batch_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.executor = executor
+        self.max_concurrent_batches = max_concurrent_batches
+        self._queue = None
+        self._worker = None
+        self._slots = None
+        self._in_flight = set()
+
+    def start(self):
+        """Starts the background worker on the running event loop."""
+        self._queue = asyncio.Queue()
+        self._slots = asyncio.Semaphore(self.max_concurrent_batches)
+        self._worker = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """
+        Cancels the worker once the batches in flight have finished. Items
+        still waiting in the queue are dropped.
+        """
+        if self._in_flight:
+            await asyncio.gather(*self._in_flight, return_exceptions=True)
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+
+    async def submit(self, item):
+        """Queues one item and waits for its result from the next batch."""
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((item, future))
+        return await future
+
+    async def _collect(self):
+        # Block until there is work, then keep collecting until the batch is
+        # full or the oldest item has waited long enough.
+        batch = [await self._queue.get()]
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _resolve(self, batch):
+        items = [item for item, _ in batch]
+        loop = asyncio.get_running_loop()
+        try:
+            results = await loop.run_in_executor(self.executor, self.batch_fn, items)
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+    async def _dispatch(self, batch):
+        try:
+            await self._resolve(batch)
+        finally:
+            self._slots.release()
+
+    async def _run(self):
+        while True:
+            # Wait for a free slot first so items pile up into bigger
+            # batches while every slot is busy.
+            await self._slots.acquire()
+            batch = await self._collect()
+            # Skip callers that gave up (e.g. disconnected) while waiting
+            batch = [entry for entry in batch if not entry[1].done()]
+            if not batch:
+                self._slots.release()
+                continue
+            task = asyncio.create_task(self._dispatch(batch))
+            self._in_flight.add(task)
+            task.add_done_callback(self._in_flight.discard)
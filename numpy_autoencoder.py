@@ -0,0 +1,41 @@
+import numpy as np
+
+ACTIVATIONS = {
+    'linear': lambda x: x,
+    'relu': lambda x: np.maximum(x, 0.0),
+    # Written with tanh so large negative inputs cannot overflow np.exp
+    'sigmoid': lambda x: 0.5 * (1.0 + np.tanh(0.5 * x)),
+    'tanh': np.tanh,
+}
+
+
+class NumpyAutoencoder:
+    """
+    Pure-NumPy forward pass for the Dense Autoencoder built in
+    train_autoencoder.py. It loads the weights written by
+    export_autoencoder.py and mirrors the Keras `predict_on_batch` call, so
+    app.py can score events without importing TensorFlow.
+    """
+
+    def __init__(self, layers):
+        # Each layer is a (kernel, bias, activation name) tuple
+        for _, _, activation in layers:
+            if activation not in ACTIVATIONS:
+                raise ValueError(f"Unsupported activation '{activation}'.")
+        self.layers = layers
+
+    @classmethod
+    def load(cls, filename):
+        with np.load(filename) as weights:
+            activations = [str(name) for name in weights['activations']]
+            layers = [
+                (weights[f'kernel_{i}'], weights[f'bias_{i}'], activation)
+                for i, activation in enumerate(activations)
+            ]
+        return cls(layers)
+
+    def predict_on_batch(self, X):
+        output = np.asarray(X, dtype=np.float32)
+        for kernel, bias, activation in self.layers:
+            output = ACTIVATIONS[activation](output @ kernel + bias)
+        return output
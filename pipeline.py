@@ -0,0 +1,366 @@
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import sys
+
+import pandas as pd
+
+from event_store import (COMBINED_EVENTS_STORE, LABELED_EVENTS_STORE, list_partitions,
+                         partition_path, read_event_store, replace_event_partitions)
+
+# Fingerprints, output digests and cached stage outputs live here
+PIPELINE_CACHE = '.pipeline_cache'
+STATE_FILENAME = 'state.json'
+
+# Cached output sets kept per stage; older ones are deleted
+CACHED_RUNS_PER_STAGE = 2
+
+RAW_LOG_FILES = ['logon-modified.csv', 'device-modified.csv', 'file-modified.csv', 'https-modified.csv']
+ANSWERS_FILENAME = 'answers.csv'
+LABELED_FILENAME = 'final_labeled_dataset-modified.csv'
+
+
+class Stage:
+    """
+    One step of the pipeline: a function over files. `inputs` and `outputs`
+    are file or directory paths, `code` the source files whose changes
+    invalidate the stage, and `params` the settings passed to `run`.
+    """
+
+    def __init__(self, name, run, inputs, outputs, code, params=None, run_partition=None, finish=None):
+        self.name = name
+        self.run = run
+        self.inputs = inputs
+        self.outputs = outputs
+        self.code = code
+        self.params = params or {}
+        # Optional per-day version of `run` over the partitions of inputs[0],
+        # and what to do once after any day was recomputed
+        self.run_partition = run_partition
+        self.finish = finish
+
+
+# --- 1. Fingerprints ---
+def _hash_file(path, state):
+    """
+    sha256 of a file's contents. Digests are remembered by (size, mtime), so
+    unchanged files are not read again on the next run.
+    """
+    stat = os.stat(path)
+    cached = state['files'].get(path)
+    if cached and cached[0] == stat.st_size and cached[1] == stat.st_mtime_ns:
+        return cached[2]
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    state['files'][path] = [stat.st_size, stat.st_mtime_ns, digest.hexdigest()]
+    return digest.hexdigest()
+
+
+def hash_path(path, state):
+    """
+    Digest of a file or a directory tree, or None if it does not exist.
+    Files inside a directory count by their folder and contents only, so
+    the random names of event store files do not change the digest.
+    """
+    if os.path.isfile(path):
+        return _hash_file(path, state)
+    if not os.path.isdir(path):
+        return None
+    entries = []
+    for folder, _, filenames in os.walk(path):
+        relative = os.path.relpath(folder, path)
+        for filename in filenames:
+            entries.append(f"{relative}:{_hash_file(os.path.join(folder, filename), state)}")
+    return hashlib.sha256("\n".join(sorted(entries)).encode()).hexdigest()
+
+
+def fingerprint(*parts):
+    return hashlib.sha256(json.dumps(parts, sort_keys=True).encode()).hexdigest()
+
+
+def stage_fingerprint(stage, state, inputs=None):
+    """Fingerprint of everything a stage's result depends on."""
+    inputs = stage.inputs if inputs is None else inputs
+    return fingerprint(
+        stage.name,
+        stage.params,
+        {path: hash_path(path, state) for path in stage.code},
+        {path: hash_path(path, state) for path in inputs},
+    )
+
+
+def load_state():
+    path = os.path.join(PIPELINE_CACHE, STATE_FILENAME)
+    if os.path.exists(path):
+        with open(path) as f:
+            return json.load(f)
+    return {'files': {}, 'stages': {}}
+
+
+def save_state(state):
+    os.makedirs(PIPELINE_CACHE, exist_ok=True)
+    # Forget digests of files that no longer exist
+    state['files'] = {path: entry for path, entry in state['files'].items() if os.path.exists(path)}
+    with open(os.path.join(PIPELINE_CACHE, STATE_FILENAME), 'w') as f:
+        json.dump(state, f, indent=2)
+
+
+# --- 2. Output Cache ---
+def _copy(source, destination):
+    if os.path.exists(destination):
+        if os.path.isdir(destination):
+            shutil.rmtree(destination)
+        else:
+            os.remove(destination)
+    parent = os.path.dirname(destination)
+    if parent:
+        os.makedirs(parent, exist_ok=True)
+    if os.path.isdir(source):
+        shutil.copytree(source, destination)
+    else:
+        shutil.copy2(source, destination)
+
+
+def cache_outputs(stage, stage_fp):
+    """Copies a stage's outputs to the cache under its fingerprint."""
+    stage_dir = os.path.join(PIPELINE_CACHE, stage.name)
+    entry_dir = os.path.join(stage_dir, stage_fp)
+    for path in stage.outputs:
+        _copy(path, os.path.join(entry_dir, path))
+
+    entries = sorted(
+        (os.path.join(stage_dir, name) for name in os.listdir(stage_dir)),
+        key=os.path.getmtime,
+    )
+    for old_entry in entries[:-CACHED_RUNS_PER_STAGE]:
+        shutil.rmtree(old_entry)
+
+
+def restore_outputs(stage, stage_fp):
+    """Restores a stage's outputs from the cache. False if they are not cached."""
+    entry_dir = os.path.join(PIPELINE_CACHE, stage.name, stage_fp)
+    cached = [os.path.join(entry_dir, path) for path in stage.outputs]
+    if not all(os.path.exists(path) for path in cached):
+        return False
+    for cached_path, path in zip(cached, stage.outputs):
+        _copy(cached_path, path)
+    os.utime(entry_dir)  # Most recently used
+    return True
+
+
+# --- 3. Running Stages ---
+def outputs_unchanged(stage, record, state):
+    return all(
+        os.path.exists(path) and hash_path(path, state) == record['outputs'].get(path)
+        for path in stage.outputs
+    )
+
+
+def run_stage(stage, state, force=False):
+    """
+    Brings one stage up to date: skips it when its fingerprint and outputs
+    match the last run, restores its outputs from the cache when this exact
+    fingerprint ran before, and only otherwise calls the stage function.
+    """
+    missing = [path for path in stage.inputs if not os.path.exists(path)]
+    if missing:
+        print(f"Error: Stage '{stage.name}' is missing its inputs: {', '.join(missing)}")
+        return False
+
+    if stage.run_partition is not None:
+        return run_partitioned_stage(stage, state, force)
+
+    stage_fp = stage_fingerprint(stage, state)
+    record = state['stages'].get(stage.name)
+    if not force and record and record['fingerprint'] == stage_fp and outputs_unchanged(stage, record, state):
+        print(f"[{stage.name}] Up to date.")
+        return True
+
+    if not force and restore_outputs(stage, stage_fp):
+        print(f"[{stage.name}] Restored outputs from the cache.")
+    else:
+        print(f"[{stage.name}] Running...")
+        # A stage function returns False when it fails without raising
+        if stage.run(**stage.params) is False:
+            print(f"Error: Stage '{stage.name}' failed.")
+            return False
+        if not all(os.path.exists(path) for path in stage.outputs):
+            print(f"Error: Stage '{stage.name}' did not produce all of its outputs.")
+            return False
+        cache_outputs(stage, stage_fp)
+
+    state['stages'][stage.name] = {
+        'fingerprint': stage_fp,
+        'outputs': {path: hash_path(path, state) for path in stage.outputs},
+    }
+    return True
+
+
+def run_partitioned_stage(stage, state, force=False):
+    """
+    Runs a stage one date partition at a time. Each day of the input store
+    is fingerprinted on its own, so when one new day of logs arrives only
+    that day is recomputed. The first output must be the partitioned store.
+    """
+    source_root, output_root = stage.inputs[0], stage.outputs[0]
+    record = state['stages'].get(stage.name)
+    partitions = record.get('partitions', {}) if record else {}
+
+    updated = {}
+    recomputed = 0
+    for date in list_partitions(source_root):
+        source_path = partition_path(source_root, date)
+        output_path = partition_path(output_root, date)
+        partition_fp = stage_fingerprint(stage, state, inputs=[source_path] + stage.inputs[1:])
+        previous = partitions.get(date)
+        if (not force and previous and previous[0] == partition_fp
+                and hash_path(output_path, state) == previous[1]):
+            updated[date] = previous
+            continue
+        stage.run_partition(date, **stage.params)
+        updated[date] = [partition_fp, hash_path(output_path, state)]
+        recomputed += 1
+
+    # Days that disappeared from the input disappear from the output too
+    removed = [date for date in list_partitions(output_root) if date not in updated]
+    for date in removed:
+        shutil.rmtree(partition_path(output_root, date))
+
+    if recomputed or removed or not all(os.path.exists(path) for path in stage.outputs):
+        print(f"[{stage.name}] Recomputed {recomputed} of {len(updated)} date partitions.")
+        if stage.finish is not None:
+            stage.finish(**stage.params)
+    else:
+        print(f"[{stage.name}] Up to date.")
+
+    state['stages'][stage.name] = {
+        'fingerprint': None,
+        'outputs': {path: hash_path(path, state) for path in stage.outputs},
+        'partitions': updated,
+    }
+    return True
+
+
+# --- 4. Stage Functions ---
+def combine(streaming, chunksize):
+    from combine_cert_data import combine_modified_cert_logs, combine_modified_cert_logs_streaming
+    if streaming:
+        combine_modified_cert_logs_streaming(chunksize=chunksize)
+    else:
+        combine_modified_cert_logs()
+
+
+def label(labeler):
+    if labeler == 'answers':
+        from create_labeled_data import label_cert_data
+        label_cert_data()
+    elif labeler == 'hunt':
+        from find_anomaly import find_and_label_anomalies
+        find_and_label_anomalies()
+    else:
+        from inject_anomaly import inject_and_label
+        inject_and_label()
+
+
+def label_partition(date, labeler):
+    """Labels one day of the combined store from the answers file."""
+    from create_labeled_data import label_events_in_windows, merge_scenario_windows
+    df_answers = pd.read_csv(ANSWERS_FILENAME, parse_dates=['start', 'end'])
+    start = pd.Timestamp(date)
+    df = read_event_store(COMBINED_EVENTS_STORE, start=start, end=start + pd.Timedelta(days=1))
+    df['timestamp'] = pd.to_datetime(df['timestamp'])
+    df['is_malicious'] = label_events_in_windows(df, merge_scenario_windows(df_answers))
+    print(f"  - {date}: labeled {df['is_malicious'].sum()} of {len(df)} events as malicious.")
+    replace_event_partitions(df, LABELED_EVENTS_STORE)
+
+
+def write_labeled_csv(labeler):
+    """Rebuilds the labeled CSV from the per-day store, in time order."""
+    df = read_event_store(LABELED_EVENTS_STORE)
+    df.sort_values(by=['timestamp', 'user_id'], kind='stable', inplace=True)
+    df.to_csv(LABELED_FILENAME, index=False)
+
+
+def train():
+    from train_autoencoder import create_and_save_autoencoder
+    create_and_save_autoencoder()
+
+
+def export():
+    from export_autoencoder import export_autoencoder_weights
+    return export_autoencoder_weights()
+
+
+def build_stages(labeler='answers', streaming=False, chunksize=100000):
+    """The combine -> label -> train -> export chain, in dependency order."""
+    label_code = {
+        'answers': 'create_labeled_data.py',
+        'hunt': 'find_anomaly.py',
+        'inject': 'inject_anomaly.py',
+    }[labeler]
+    return [
+        Stage('combine', combine,
+              inputs=RAW_LOG_FILES,
+              outputs=['combined_log-final.csv', COMBINED_EVENTS_STORE, 'content_store'],
+              code=['combine_cert_data.py', 'content_store.py', 'event_store.py'],
+              params={'streaming': streaming, 'chunksize': chunksize}),
+        Stage('label', label,
+              inputs=[COMBINED_EVENTS_STORE] + ([ANSWERS_FILENAME] if labeler == 'answers' else []),
+              outputs=[LABELED_EVENTS_STORE, LABELED_FILENAME],
+              code=[label_code, 'event_store.py'],
+              params={'labeler': labeler},
+              # Answer-key labels of one day only depend on that day's events
+              run_partition=label_partition if labeler == 'answers' else None,
+              finish=write_labeled_csv),
+        Stage('train', train,
+              inputs=[LABELED_EVENTS_STORE],
+              outputs=['final_autoencoder_model.h5', 'data_scaler.joblib', 'feature_schema.json'],
+              code=['train_autoencoder.py', 'feature_cache.py', 'window_features.py',
+                    'feature_schema.py', 'event_store.py']),
+        Stage('export', export,
+              inputs=['final_autoencoder_model.h5'],
+              outputs=['autoencoder_weights.npz'],
+              code=['export_autoencoder.py', 'numpy_autoencoder.py']),
+    ]
+
+
+def run_pipeline(labeler='answers', streaming=False, chunksize=100000, until=None, force=False):
+    """
+    Runs the offline pipeline, recomputing only the stages (and, for the
+    answer-key labels, only the days) whose inputs, code or parameters
+    changed since the last run.
+    """
+    state = load_state()
+    try:
+        for stage in build_stages(labeler, streaming, chunksize):
+            if not run_stage(stage, state, force=force):
+                print("Pipeline stopped.")
+                return False
+            if stage.name == until:
+                break
+    finally:
+        save_state(state)
+    print("\nPipeline complete!")
+    return True
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Run the offline pipeline, skipping work whose inputs did not change.")
+    parser.add_argument('--labeler', choices=['answers', 'hunt', 'inject'], default='answers',
+                        help="How events are labeled: the answers file, find_anomaly.py or inject_anomaly.py.")
+    parser.add_argument('--streaming', action='store_true',
+                        help="Use the out-of-core combine (see combine_cert_data.py).")
+    parser.add_argument('--chunksize', type=int, default=100000,
+                        help="Rows per chunk for the streaming combine.")
+    parser.add_argument('--until', choices=['combine', 'label', 'train', 'export'],
+                        help="Stop after this stage.")
+    parser.add_argument('--force', action='store_true',
+                        help="Recompute every stage, ignoring the cache.")
+    args = parser.parse_args()
+
+    if not run_pipeline(args.labeler, args.streaming, args.chunksize, args.until, args.force):
+        sys.exit(1)
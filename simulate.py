@@ -4,9 +4,12 @@ import time
 import json
 import numpy as np
 
+from event_store import LABELED_EVENTS_STORE, load_events
+
 def simulate_real_time_activity():
     filename = 'final_labeled_dataset-modified.csv'
-    df = pd.read_csv(filename)
+    df = load_events(LABELED_EVENTS_STORE, filename)
+    df['timestamp'] = df['timestamp'].astype(str)
     # Shuffle the data to make the simulation more interesting
     records = df.sample(frac=1).to_dict(orient='records')
     url = 'http://127.0.0.1:8000/predict'
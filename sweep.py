@@ -0,0 +1,277 @@
+import argparse
+import itertools
+import json
+import multiprocessing
+import os
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+
+import joblib
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import IsolationForest
+from sklearn.metrics import precision_recall_fscore_support
+from sklearn.preprocessing import MinMaxScaler
+
+from calibrate_threshold import DEFAULT_ALERT_THRESHOLD
+from feature_cache import FeatureCache, open_feature_cache
+from feature_schema import FeatureSchema, schema_path
+
+# Declared search space per model family. A 'feature_set' names feature
+# cache sets, joined with '+' to use several side by side.
+SWEEP_GRID = {
+    'isolation_forest': {
+        'feature_set': ['resource', 'behavior'],
+        'n_estimators': [100, 200],
+        'max_samples': ['auto', 256, 1024],
+        'contamination': ['auto', 0.01, 0.05],
+    },
+    'autoencoder': {
+        'feature_set': ['behavior', 'behavior+window'],
+        'encoding_dim': [2, 4],
+        'epochs': [10, 20],
+    },
+}
+
+SWEEP_DIR = 'sweep_results'
+RESULTS_FILENAME = 'results.json'
+
+# Where the best model of each family is saved
+BEST_ARTIFACTS = {
+    'isolation_forest': 'final_cert_model_tuned.joblib',
+    'autoencoder': 'final_autoencoder_model_tuned.h5',
+}
+
+# Trials compare at app.py's uncalibrated threshold; calibrate the winner
+# with calibrate_threshold.py
+ALERT_THRESHOLD = DEFAULT_ALERT_THRESHOLD
+AUTOENCODER_BATCH_SIZE = 32
+
+# Opened once per worker process
+_features = None
+
+
+def _init_worker(root, manifest):
+    global _features
+    _features = FeatureCache(root, manifest)
+
+
+def _feature_frame(feature_set):
+    """
+    The named feature sets as one DataFrame. A single set stays a view of
+    the memory-mapped cache, which all workers share through the page cache.
+    """
+    names = feature_set.split('+')
+    columns = [col for name in names for col in _features.columns(name)]
+    if len(names) == 1:
+        matrix = _features.matrix(names[0])
+    else:
+        matrix = np.hstack([np.asarray(_features.matrix(name), dtype=np.float64) for name in names])
+    return pd.DataFrame(matrix, columns=columns, copy=False)
+
+
+def _scores(y_true, predicted_labels):
+    precision, recall, f1, _ = precision_recall_fscore_support(
+        y_true, predicted_labels, average='binary', zero_division=0)
+    return {
+        'precision': float(precision),
+        'recall': float(recall),
+        'f1': float(f1),
+        'alert_rate': float(np.mean(predicted_labels)),
+    }
+
+
+def _trial_encoders(params):
+    # Saved with every model, so it can be scored on a rebuilt cache later
+    encoders = {}
+    for name in params['feature_set'].split('+'):
+        encoders.update(_features.encoders(name))
+    return encoders
+
+
+def _fit_isolation_forest(params, X, y_true, artifact):
+    # One core per trial; the pool runs the trials in parallel
+    model = IsolationForest(n_estimators=params['n_estimators'], max_samples=params['max_samples'],
+                            contamination=params['contamination'], random_state=42, n_jobs=1)
+    started = time.perf_counter()
+    model.fit(X[y_true == 0])
+    fit_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    predicted_labels = model.predict(X) == -1
+    score_seconds = time.perf_counter() - started
+
+    joblib.dump(model, artifact)
+    FeatureSchema.from_training(list(X.columns), _trial_encoders(params)).save(schema_path(artifact))
+    return fit_seconds, score_seconds, predicted_labels
+
+
+def _fit_autoencoder(params, X, y_true, artifact):
+    # Imported here, so only workers that train autoencoders load TensorFlow
+    from tensorflow import keras
+    from tensorflow.keras.layers import Dense, Input
+    from tensorflow.keras.models import Model
+
+    keras.utils.set_random_seed(42)
+    started = time.perf_counter()
+    scaler = MinMaxScaler()
+    X_scaled = scaler.fit_transform(X)
+    X_train_normal = X_scaled[y_true == 0]
+
+    input_layer = Input(shape=(X_scaled.shape[1],))
+    encoder_layer = Dense(params['encoding_dim'], activation='relu')(input_layer)
+    decoder_layer = Dense(X_scaled.shape[1], activation='sigmoid')(encoder_layer)
+    autoencoder = Model(inputs=input_layer, outputs=decoder_layer)
+    autoencoder.compile(optimizer='adam', loss='mean_squared_error')
+    autoencoder.fit(X_train_normal, X_train_normal, epochs=params['epochs'],
+                    batch_size=AUTOENCODER_BATCH_SIZE, shuffle=True, verbose=0)
+    fit_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    reconstructions = autoencoder.predict(X_scaled, batch_size=4096, verbose=0)
+    errors = np.mean(np.square(X_scaled - reconstructions), axis=1)
+    predicted_labels = errors > ALERT_THRESHOLD
+    score_seconds = time.perf_counter() - started
+
+    autoencoder.save(artifact)
+    joblib.dump(scaler, scaler_path(artifact))
+    FeatureSchema.from_training(list(X.columns), _trial_encoders(params), scaler).save(schema_path(artifact))
+    return fit_seconds, score_seconds, predicted_labels
+
+
+TRAINERS = {
+    'isolation_forest': _fit_isolation_forest,
+    'autoencoder': _fit_autoencoder,
+}
+
+
+def scaler_path(artifact):
+    """The autoencoder's data scaler, saved next to the model."""
+    return os.path.splitext(artifact)[0] + '_scaler.joblib'
+
+
+def run_trial(trial):
+    """Process-pool worker: fits one configuration and scores it on the labeled set."""
+    X = _feature_frame(trial['params']['feature_set'])
+    y_true = np.asarray(_features.labels)
+    fit_seconds, score_seconds, predicted_labels = TRAINERS[trial['family']](
+        trial['params'], X, y_true, trial['artifact'])
+    result = dict(trial)
+    result.update(_scores(y_true, predicted_labels))
+    result['fit_seconds'] = round(fit_seconds, 4)
+    result['score_seconds'] = round(score_seconds, 4)
+    return result
+
+
+def expand_grid(grid, trials_dir):
+    """One trial per combination of each family's parameter values."""
+    trials = []
+    for family, space in grid.items():
+        extension = os.path.splitext(BEST_ARTIFACTS[family])[1]
+        names = list(space)
+        for index, values in enumerate(itertools.product(*(space[name] for name in names))):
+            trial_id = f'{family}-{index:03d}'
+            trials.append({
+                'trial_id': trial_id,
+                'family': family,
+                'params': dict(zip(names, values)),
+                'artifact': os.path.join(trials_dir, trial_id + extension),
+            })
+    return trials
+
+
+def _save_best(best):
+    """Moves the winning trial's files to the family's artifact path."""
+    destination = BEST_ARTIFACTS[best['family']]
+    os.replace(best['artifact'], destination)
+    os.replace(schema_path(best['artifact']), schema_path(destination))
+    if best['family'] == 'autoencoder':
+        os.replace(scaler_path(best['artifact']), scaler_path(destination))
+    return destination
+
+
+def run_sweep(grid=SWEEP_GRID, workers=None, output_dir=SWEEP_DIR, metric='f1'):
+    """
+    Runs every trial of the grid in a process pool, writes all metrics and
+    timings to `<output_dir>/results.json` and saves the best model of each
+    family (highest `metric`, then fastest fit) to BEST_ARTIFACTS.
+    """
+    # --- 1. Open the Shared Feature Cache ---
+    # Built here if needed, so the workers only ever open it read-only
+    features = open_feature_cache()
+    trials_dir = os.path.join(output_dir, 'trials')
+    os.makedirs(trials_dir, exist_ok=True)
+    trials = expand_grid(grid, trials_dir)
+    print(f"Running {len(trials)} trials over {features.manifest['rows']} events...")
+
+    # --- 2. Run the Trials in Parallel ---
+    # 'spawn' gives every worker a fresh interpreter, which TensorFlow needs
+    results = []
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=_init_worker,
+                             initargs=(features.root, features.manifest)) as pool:
+        for result in pool.map(run_trial, trials):
+            print(f"  {result['trial_id']}: {metric}={result[metric]:.3f} "
+                  f"(fit {result['fit_seconds']:.2f}s) {result['params']}")
+            results.append(result)
+
+    # --- 3. Keep the Best Model of Each Family ---
+    best = {}
+    for family in grid:
+        family_results = [result for result in results if result['family'] == family]
+        if not family_results:
+            continue
+        winner = max(family_results, key=lambda result: (result[metric], -result['fit_seconds']))
+        winner['artifact'] = _save_best(winner)
+        best[family] = winner['trial_id']
+        print(f"Best {family}: {winner['trial_id']} with {metric}={winner[metric]:.3f}, "
+              f"saved to '{winner['artifact']}'.")
+    shutil.rmtree(trials_dir)
+    for result in results:
+        if result['trial_id'] not in best.values():
+            result['artifact'] = None
+
+    # --- 4. Record the Sweep ---
+    summary = {
+        'created_at': datetime.now(timezone.utc).isoformat(),
+        'feature_cache': {
+            'source': features.manifest['source'],
+            'rows': features.manifest['rows'],
+        },
+        'metric': metric,
+        'grid': grid,
+        'best': best,
+        'trials': results,
+    }
+    results_path = os.path.join(output_dir, RESULTS_FILENAME)
+    with open(results_path, 'w') as f:
+        json.dump(summary, f, indent=2)
+    print(f"Sweep results written to '{results_path}'.")
+    return summary
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Hyperparameter sweep over the IsolationForest and Autoencoder models.")
+    parser.add_argument('--grid', help="JSON file with a grid to use instead of SWEEP_GRID.")
+    parser.add_argument('--models', nargs='+', choices=sorted(SWEEP_GRID),
+                        help="Only sweep these model families.")
+    parser.add_argument('--workers', type=int, default=None,
+                        help="Worker processes (default: one per CPU).")
+    parser.add_argument('--output-dir', default=SWEEP_DIR, help="Where to write the results.")
+    parser.add_argument('--metric', default='f1', choices=['precision', 'recall', 'f1'],
+                        help="Metric that picks the best trial.")
+    args = parser.parse_args()
+
+    grid = SWEEP_GRID
+    if args.grid:
+        with open(args.grid) as f:
+            grid = json.load(f)
+    if args.models:
+        grid = {family: space for family, space in grid.items() if family in args.models}
+
+    try:
+        run_sweep(grid, workers=args.workers, output_dir=args.output_dir, metric=args.metric)
+    except FileNotFoundError:
+        print("Error: labeled CERT data not found. Run one of the labeling scripts first.")
@@ -1,8 +1,8 @@
-import pandas as pd
 import joblib
-from sklearn.preprocessing import LabelEncoder
 from sklearn.metrics import classification_report, confusion_matrix
 
+from feature_cache import open_feature_cache
+
 def test_model_on_cert_data():
     """
     Loads a pre-trained model and evaluates it on the prepared CERT dataset.
@@ -22,8 +22,8 @@ def test_model_on_cert_data():
         return
 
     try:
-        print(f"Loading CERT test data from '{cert_data_filename}'...")
-        df_cert = pd.read_csv(cert_data_filename, low_memory=False)
+        print("Loading CERT test features from the feature cache...")
+        features = open_feature_cache()
         print("CERT data loaded successfully.")
     except FileNotFoundError:
         print(f"Error: CERT data file '{cert_data_filename}' not found.")
@@ -31,43 +31,21 @@ def test_model_on_cert_data():
         return
 
     # --- 2. Adapt CERT Data to Match Model's Expected Features ---
-    print("\nAdapting CERT data to match the features the model was trained on...")
-    
-    # This list MUST match the categorical_cols from your train.py script
+    # feature_cache.py maps event_type to 'action_type', filename/url to
+    # 'resource_accessed' and adds a placeholder 'success', label-encoded
+    # the same way as in train.py. This list MUST match its categorical_cols.
     expected_features = ["action_type", "resource_accessed", "success"]
-    
-    # --- Feature Mapping ---
-    # a. Create 'action_type' from 'event_type'
-    df_cert['action_type'] = df_cert['event_type']
-    
-    # b. Create 'resource_accessed' by combining 'url' and 'filename'
-    #    We fill empty values from one with values from the other.
-    df_cert['resource_accessed'] = df_cert['filename'].fillna(df_cert['url'])
-    
-    # c. Create a 'success' column since the model expects it.
-    #    Since CERT data doesn't have this, we'll fill it with a consistent value.
-    df_cert['success'] = 'success' # A placeholder value
-
-    # Fill any remaining missing values in our new columns
-    for col in expected_features:
-        df_cert[col] = df_cert[col].fillna('missing')
-
-    # Apply the same Label Encoding as in your training script
-    for col in expected_features:
-        encoder = LabelEncoder()
-        df_cert[col] = encoder.fit_transform(df_cert[col].astype(str))
-        
-    print("Feature adaptation complete.")
+    print("\nUsing the CERT features adapted to the model's training features.")
 
     # --- 3. Make Predictions on the Adapted CERT Data ---
-    X_cert_test = df_cert[expected_features]
-    y_cert_true = df_cert['is_malicious']
+    X_cert_test = features.frame('resource')[expected_features]
+    y_cert_true = features.labels
 
     print("\nMaking predictions on the CERT dataset...")
     predictions = model.predict(X_cert_test)
     
     # Convert predictions (1 for normal, -1 for anomaly) to our label format (0, 1)
-    predicted_labels = [1 if p == -1 else 0 for p in predictions]
+    predicted_labels = (predictions == -1).astype(int)
 
     # --- 4. Evaluate Performance on CERT Data ---
     print("\n--- Final Model Performance on CERT Dataset ---")
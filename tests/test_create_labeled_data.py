@@ -0,0 +1,34 @@
+import pandas as pd
+
+from create_labeled_data import label_events_in_windows, merge_scenario_windows
+
+
+def _windows(rows):
+    answers = pd.DataFrame(rows, columns=['user_id', 'start', 'end'])
+    answers['start'] = pd.to_datetime(answers['start'])
+    answers['end'] = pd.to_datetime(answers['end'])
+    return merge_scenario_windows(answers)
+
+
+def test_events_inside_a_window_are_labeled():
+    logs = pd.DataFrame({
+        'user_id': ['U1', 'U1', 'U2', 'U1'],
+        'timestamp': pd.to_datetime(
+            ['2010-01-02 10:00', '2010-01-01 09:00', '2010-01-02 10:00', '2010-01-03 00:00']),
+    })
+    windows = _windows([('U1', '2010-01-02 00:00', '2010-01-02 23:59')])
+
+    assert label_events_in_windows(logs, windows).tolist() == [1, 0, 0, 0]
+
+
+def test_events_without_a_timestamp_are_labeled_normal():
+    logs = pd.DataFrame({
+        'user_id': ['U1', 'U1', 'U1', None],
+        'timestamp': pd.to_datetime(['2010-01-02 10:00', None, '2010-01-05 10:00', None]),
+    }, index=[10, 11, 12, 13])
+    windows = _windows([('U1', '2010-01-02 00:00', '2010-01-02 23:59')])
+
+    labels = label_events_in_windows(logs, windows)
+
+    assert labels.index.tolist() == [10, 11, 12, 13]
+    assert labels.tolist() == [1, 0, 0, 0]
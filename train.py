@@ -4,6 +4,8 @@ from sklearn.ensemble import IsolationForest
 from sklearn.preprocessing import LabelEncoder
 from sklearn.metrics import classification_report, confusion_matrix
 
+from feature_schema import FeatureSchema, schema_path
+
 def train_and_save_model():
     """
     This function loads your synthetic data, trains an unsupervised 
@@ -36,9 +38,11 @@ def train_and_save_model():
         return
 
     # Encode your categorical features into numbers
+    encoders = {}
     for col in categorical_cols:
         encoder = LabelEncoder()
         df[col] = encoder.fit_transform(df[col].astype(str))
+        encoders[col] = encoder
 
     # Separate features (X) and the true label (y)
     X = df[feature_columns]
@@ -61,13 +65,15 @@ def train_and_save_model():
     model_filename = 'insider_threat_model.joblib'
     print(f"Saving the trained model to {model_filename}...")
     joblib.dump(model, model_filename)
+    # The category codes it was trained with, for evaluate_models.py
+    FeatureSchema.from_training(feature_columns, encoders).save(schema_path(model_filename))
     print("Model saved successfully.")
 
     # --- 6. (Optional) Evaluate on Your Test Data ---
     # You can now see how well your model performed on your own data
     print("\n--- Evaluating model on your full synthetic dataset ---")
     predictions = model.predict(X)
-    predicted_labels = [1 if p == -1 else 0 for p in predictions]
+    predicted_labels = (predictions == -1).astype(int)
 
     print("\nClassification Report:")
     print(classification_report(y_true, predicted_labels))
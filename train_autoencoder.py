@@ -1,55 +1,117 @@
+import argparse
 import pandas as pd
 import numpy as np
 import joblib
-from sklearn.preprocessing import LabelEncoder, MinMaxScaler
+from sklearn.preprocessing import MinMaxScaler
 from sklearn.metrics import classification_report, confusion_matrix
 import tensorflow as tf
 from tensorflow.keras.models import Model
 from tensorflow.keras.layers import Input, Dense
 
-def create_and_save_autoencoder():
+from feature_cache import open_feature_cache
+from feature_schema import FeatureSchema
+
+# Training hyperparameters, shared by the in-memory and streaming modes
+EPOCHS = 20
+BATCH_SIZE = 32
+
+def read_feature_block(matrices, start, stop):
+    """
+    Rows start:stop of the feature matrices side by side. The matrices are
+    memory maps, so only this block is read into memory.
+    """
+    return np.hstack([np.asarray(m[start:stop], dtype=np.float64) for m in matrices])
+
+def fit_scaler_in_chunks(matrices, feature_columns, chunksize):
+    """Fits the MinMaxScaler one block at a time; same result as one fit()."""
+    scaler = MinMaxScaler()
+    for start in range(0, len(matrices[0]), chunksize):
+        chunk = read_feature_block(matrices, start, start + chunksize)
+        scaler.partial_fit(pd.DataFrame(chunk, columns=feature_columns))
+    return scaler
+
+def normal_events_dataset(matrices, labels, scaler, feature_columns, chunksize):
+    """
+    tf.data pipeline over the scaled 'normal' events, with the number of
+    batches per epoch. A generator reads the blocks in a new random order
+    every epoch, shuffles the rows within each block and hands out (x, x)
+    batches, prefetched while the model trains on the previous ones.
+    """
+    starts = np.arange(0, len(labels), chunksize)
+    # Only the labels are read to size the epoch
+    normal_per_block = [int(np.sum(np.asarray(labels[start:start + chunksize]) == 0)) for start in starts]
+    steps_per_epoch = sum(-(-count // BATCH_SIZE) for count in normal_per_block)
+
+    def batches():
+        for start in np.random.permutation(starts):
+            chunk = read_feature_block(matrices, start, start + chunksize)
+            chunk = chunk[np.asarray(labels[start:start + chunksize]) == 0]
+            scaled = scaler.transform(pd.DataFrame(chunk, columns=feature_columns)).astype(np.float32)
+            scaled = scaled[np.random.permutation(len(scaled))]
+            for batch_start in range(0, len(scaled), BATCH_SIZE):
+                batch = scaled[batch_start:batch_start + BATCH_SIZE]
+                yield batch, batch
+
+    spec = tf.TensorSpec(shape=(None, len(feature_columns)), dtype=tf.float32)
+    dataset = tf.data.Dataset.from_generator(batches, output_signature=(spec, spec))
+    return dataset.repeat().prefetch(tf.data.AUTOTUNE), steps_per_epoch
+
+def create_and_save_autoencoder(window_features=False, streaming=False, chunksize=100000):
     """
     This script builds, trains, and saves the final Autoencoder model
-    and the data scaler needed for the dashboard application.
+    and the data scaler needed for the dashboard application. With
+    `window_features`, the per-user sliding-window counts are added to the
+    inputs; app.py computes the same values live. With `streaming`, the
+    features are scaled and fed to Keras `chunksize` rows at a time, so
+    the training set never has to fit in memory.
     """
     # --- 1. Load and Prepare Data ---
     cert_data_filename = 'final_labeled_dataset-modified.csv'
     
     try:
-        df = pd.read_csv(cert_data_filename, low_memory=False)
-    except FileNotFoundError:
-        print(f"Error: CERT data file '{cert_data_filename}' not found.")
+        # Features are built once and shared by all trainers via the cache.
+        # Building it reads the whole labeled dataset, so streaming mode
+        # only opens an existing one.
+        features = open_feature_cache(build=not streaming)
+    except FileNotFoundError as e:
+        print(f"Error: {e}" if streaming else f"Error: CERT data file '{cert_data_filename}' not found.")
         return
 
     print("Starting Autoencoder training and saving process...")
     
     # --- Feature Engineering ---
-    df['timestamp'] = pd.to_datetime(df['timestamp'])
-    df['date'] = df['timestamp'].dt.date
-    df['logon_hour'] = df['timestamp'].dt.hour
-    daily_activity = df.groupby(['user_id', 'date']).size().reset_index(name='user_daily_activity_count')
-    df = pd.merge(df, daily_activity, on=['user_id', 'date'], how='left')
+    # Done by feature_cache.py: event type, logon hour, daily activity count
+    feature_columns = features.columns('behavior')
+    encoders = features.encoders('behavior')
 
-    feature_columns = ["event_type", "logon_hour", "user_daily_activity_count"]
-    
-    for col in ["event_type"]:
-        df[col] = df[col].fillna('missing')
-        encoder = LabelEncoder()
-        df[col] = encoder.fit_transform(df[col].astype(str))
-        
-    X = df[feature_columns]
-    y_true = df['is_malicious']
-
-    # --- 2. Data Scaling for Neural Networks ---
-    scaler = MinMaxScaler()
-    X_scaled = scaler.fit_transform(X)
+    matrices = [features.matrix('behavior')]
+    if window_features:
+        feature_columns += features.columns('window')
+        matrices.append(features.matrix('window'))
+    y_true = features.labels
+
+    if streaming:
+        # --- 2. Data Scaling, One Chunk at a Time ---
+        print(f"Fitting the scaler in chunks of {chunksize} rows...")
+        scaler = fit_scaler_in_chunks(matrices, feature_columns, chunksize)
 
-    # --- 3. Separate Data for Training ---
-    X_train_normal = X_scaled[y_true == 0]
-    print(f"Training the Autoencoder on {len(X_train_normal)} 'normal' events.")
+        # --- 3. Stream the 'Normal' Events ---
+        train_data, steps_per_epoch = normal_events_dataset(matrices, y_true, scaler, feature_columns, chunksize)
+        print(f"Training the Autoencoder on {int(np.sum(y_true == 0))} 'normal' events, streamed in chunks.")
+    else:
+        X = pd.concat([pd.DataFrame(m, copy=False) for m in matrices], axis=1)
+        X.columns = feature_columns
+
+        # --- 2. Data Scaling for Neural Networks ---
+        scaler = MinMaxScaler()
+        X_scaled = scaler.fit_transform(X)
+
+        # --- 3. Separate Data for Training ---
+        X_train_normal = X_scaled[y_true == 0]
+        print(f"Training the Autoencoder on {len(X_train_normal)} 'normal' events.")
 
     # --- 4. Build and Train the Autoencoder Model ---
-    input_dim = X_train_normal.shape[1]
+    input_dim = len(feature_columns)
     input_layer = Input(shape=(input_dim,))
     encoder_layer = Dense(2, activation="relu")(input_layer)
     decoder_layer = Dense(input_dim, activation='sigmoid')(encoder_layer)
@@ -58,11 +120,16 @@ def create_and_save_autoencoder():
     autoencoder.compile(optimizer='adam', loss='mean_squared_error')
     
     print("Training the Autoencoder...")
-    autoencoder.fit(X_train_normal, X_train_normal,
-                    epochs=20,
-                    batch_size=32,
-                    shuffle=True,
-                    verbose=0) # Set verbose to 0 to keep the output clean
+    if streaming:
+        # The generator already shuffles, block order and rows within blocks
+        autoencoder.fit(train_data, epochs=EPOCHS, steps_per_epoch=steps_per_epoch,
+                        shuffle=False, verbose=0)
+    else:
+        autoencoder.fit(X_train_normal, X_train_normal,
+                        epochs=EPOCHS,
+                        batch_size=BATCH_SIZE,
+                        shuffle=True,
+                        verbose=0) # Set verbose to 0 to keep the output clean
     
     print("Training complete.")
     
@@ -73,9 +140,23 @@ def create_and_save_autoencoder():
     print("Saving the data scaler as 'data_scaler.joblib'...")
     joblib.dump(scaler, 'data_scaler.joblib')
     
+    # The app loads only this small schema, never the training data
+    print("Saving the feature schema as 'feature_schema.json'...")
+    FeatureSchema.from_training(feature_columns, encoders, scaler).save('feature_schema.json')
+    
     print("\nModel and scaler saved successfully!")
     print("You are now ready to build the dashboard.")
 
 
 if __name__ == '__main__':
-    create_and_save_autoencoder()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Train the Autoencoder and save it for the dashboard.")
+    parser.add_argument('--window-features', action='store_true',
+                        help="Also train on the per-user sliding-window features.")
+    parser.add_argument('--streaming', action='store_true',
+                        help="Scale and train in chunks, for data that does not fit in memory.")
+    parser.add_argument('--chunksize', type=int, default=100000,
+                        help="Rows per chunk in streaming mode.")
+    args = parser.parse_args()
+
+    create_and_save_autoencoder(window_features=args.window_features,
+                                streaming=args.streaming, chunksize=args.chunksize)
\ No newline at end of file
@@ -0,0 +1,74 @@
+import numpy as np
+import pandas as pd
+
+
+class UserDayCube:
+    """
+    Dense per-(user, day) metrics: `values[u, d, m]` is metric `m` of user
+    `users[u]` on day `days[d]`. Every event keeps its (user, day) cell
+    position, so cube results map back onto events by plain indexing
+    instead of merging frames.
+    """
+
+    def __init__(self, users, days, metrics, values, user_codes, day_codes):
+        self.users = users
+        self.days = days
+        self.metrics = list(metrics)
+        self.values = values
+        self.user_codes = user_codes
+        self.day_codes = day_codes
+
+    def __getitem__(self, metric):
+        """One metric as a (users x days) matrix."""
+        return self.values[:, :, self.metrics.index(metric)]
+
+    def per_event(self, cells):
+        """
+        Looks a (users x days) matrix up for every event. Events without a
+        user or timestamp get NaN, as they would from a groupby and left merge.
+        """
+        has_cell = (self.user_codes >= 0) & (self.day_codes >= 0)
+        result = np.full(len(self.user_codes), np.nan)
+        result[has_cell] = cells[self.user_codes[has_cell], self.day_codes[has_cell]]
+        return result
+
+    def to_frame(self, active_metric=None):
+        """
+        The cube as a long (user_id, date, metrics...) frame. With
+        `active_metric`, only cells where that metric is non-zero are kept.
+        """
+        user_index, day_index = np.indices(self.values.shape[:2]).reshape(2, -1)
+        flat = self.values.reshape(-1, len(self.metrics))
+        if active_metric is not None:
+            keep = flat[:, self.metrics.index(active_metric)] != 0
+            user_index, day_index, flat = user_index[keep], day_index[keep], flat[keep]
+        frame = pd.DataFrame(flat, columns=self.metrics)
+        frame.insert(0, 'date', self.days[day_index])
+        frame.insert(0, 'user_id', self.users[user_index])
+        return frame
+
+
+def build_user_day_cube(user_ids, timestamps, metrics):
+    """
+    Aggregates event-level metrics into a UserDayCube in one pass.
+
+    `metrics` maps a metric name to an event-level array of weights (e.g. a
+    boolean mask to count matching events). Users and days are coded to
+    integers once, and each metric is then a single `np.bincount` over the
+    combined (user, day) key.
+    """
+    user_codes, users = pd.factorize(pd.Series(user_ids).astype(object))
+    day_codes, days = pd.factorize(pd.to_datetime(pd.Series(timestamps)).dt.date, sort=True)
+    user_codes = np.asarray(user_codes)
+    day_codes = np.asarray(day_codes)
+
+    # Events without a user or timestamp fall outside every cell
+    valid = (user_codes >= 0) & (day_codes >= 0)
+    keys = user_codes[valid] * len(days) + day_codes[valid]
+    cells = len(users) * len(days)
+    values = np.empty((len(users), len(days), len(metrics)))
+    for index, weights in enumerate(metrics.values()):
+        weights = np.asarray(weights, dtype=float)[valid]
+        values[:, :, index] = np.bincount(keys, weights=weights, minlength=cells).reshape(len(users), len(days))
+
+    return UserDayCube(np.asarray(users), np.asarray(days), metrics.keys(), values, user_codes, day_codes)
@@ -0,0 +1,194 @@
+import argparse
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+# Checkpoint of the live sketches, seeded offline by this script
+SKETCH_FILENAME = 'user_error_sketches.npz'
+SKETCH_VERSION = 1
+
+# Quantiles are exact to within this relative error
+RELATIVE_ACCURACY = 0.05
+# Errors at or below the first bound share one bin, errors above the
+# second share another; everything in between gets log-spaced bins
+MIN_TRACKED_ERROR = 1e-6
+MAX_TRACKED_ERROR = 10.0
+
+
+def _normalize(user_ids):
+    # Same key for a missing user as the rest of the live state
+    return pd.Series(user_ids).reset_index(drop=True).astype(object).fillna('missing').astype(str).to_numpy(dtype=object)
+
+
+class UserErrorSketches:
+    """
+    A fixed-size quantile sketch of reconstruction error for every user, in
+    the style of DDSketch. All users share one set of logarithmic bins, so
+    a user's sketch is a row of bin counts in a (users x bins) matrix, any
+    quantile is accurate to `relative_accuracy`, and sketches merge by
+    adding rows. Memory is 4 bytes per bin per user, however many events
+    each user has.
+    """
+
+    def __init__(self, relative_accuracy=RELATIVE_ACCURACY, min_value=MIN_TRACKED_ERROR,
+                 max_value=MAX_TRACKED_ERROR):
+        self.relative_accuracy = relative_accuracy
+        self.min_value = min_value
+        self.max_value = max_value
+        gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = np.log(gamma)
+        # Bin i > 0 covers (min * gamma^(i-1), min * gamma^i]; the last one
+        # also takes every error above max_value
+        self.n_bins = int(np.ceil(np.log(max_value / min_value) / self._log_gamma)) + 2
+        powers = np.arange(self.n_bins, dtype=np.float64)
+        # The value returned for each bin is within relative_accuracy of
+        # every error in it
+        self._bin_values = min_value * 2 * gamma ** powers / (gamma + 1)
+        self._bin_values[0] = min_value
+        self._bin_values[-1] = max(self._bin_values[-1], max_value)
+
+        self._users = {}
+        self._counts = np.zeros((0, self.n_bins), dtype=np.uint32)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._users)
+
+    @property
+    def memory_bytes(self):
+        return self._counts.nbytes
+
+    def _bins(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        bins = np.zeros(len(values), dtype=np.int64)
+        above = values > self.min_value
+        bins[above] = np.ceil(np.log(values[above] / self.min_value) / self._log_gamma)
+        return np.clip(bins, 0, self.n_bins - 1)
+
+    def _rows(self, user_ids, create):
+        rows = np.fromiter((self._users.get(user, -1) for user in user_ids), dtype=np.int64, count=len(user_ids))
+        if create and (rows < 0).any():
+            for index in np.flatnonzero(rows < 0):
+                user = user_ids[index]
+                if user not in self._users:
+                    self._users[user] = len(self._users)
+                rows[index] = self._users[user]
+            if len(self._users) > len(self._counts):
+                # Grows by doubling, so adding users is O(1) amortized
+                grown = np.zeros((max(len(self._users), 2 * len(self._counts)), self.n_bins), dtype=np.uint32)
+                grown[:len(self._counts)] = self._counts
+                self._counts = grown
+        return rows
+
+    def add_many(self, user_ids, values):
+        """Records one error per event. NaN errors are skipped."""
+        users = _normalize(user_ids)
+        values = np.asarray(values, dtype=np.float64)
+        keep = ~np.isnan(values)
+        with self._lock:
+            rows = self._rows(users[keep], create=True)
+            np.add.at(self._counts, (rows, self._bins(values[keep])), 1)
+
+    def quantiles(self, user_ids, q, min_count=1):
+        """
+        Each event's user's `q` quantile of error, or NaN for users with
+        fewer than `min_count` recorded errors.
+        """
+        users = _normalize(user_ids)
+        result = np.full(len(users), np.nan)
+        with self._lock:
+            rows = self._rows(users, create=False)
+            known = np.flatnonzero(rows >= 0)
+            cumulative = np.cumsum(self._counts[rows[known]], axis=1, dtype=np.int64)
+        if known.size == 0:
+            return result
+        totals = cumulative[:, -1]
+        # The bin holding the rank-th smallest error, as in numpy's 'lower'
+        ranks = np.floor(q * (totals - 1))
+        bins = np.argmax(cumulative > ranks[:, None], axis=1)
+        enough = totals >= max(min_count, 1)
+        result[known[enough]] = self._bin_values[bins[enough]]
+        return result
+
+    def _same_bins(self, other):
+        return (self.relative_accuracy, self.min_value, self.max_value) == \
+            (other.relative_accuracy, other.min_value, other.max_value)
+
+    def merge(self, other):
+        """Adds another set of sketches with the same bins into this one."""
+        if not self._same_bins(other):
+            raise ValueError("Only sketches with the same accuracy and range can be merged.")
+        with other._lock:
+            users = np.array(list(other._users), dtype=object)
+            counts = other._counts[:len(users)].copy()
+        with self._lock:
+            rows = self._rows(users, create=True)
+            self._counts[rows] += counts
+
+    def save(self, filename):
+        """Checkpoints the sketches; a new file replaces the old one atomically."""
+        with self._lock:
+            users = np.array(list(self._users), dtype=str)
+            counts = self._counts[:len(users)].copy()
+        temporary_path = f'{filename}.tmp'
+        with open(temporary_path, 'wb') as f:
+            np.savez(f, version=SKETCH_VERSION, users=users, counts=counts,
+                     params=np.array([self.relative_accuracy, self.min_value, self.max_value]))
+        os.replace(temporary_path, filename)
+
+    @classmethod
+    def load(cls, filename):
+        with np.load(filename) as data:
+            if int(data['version']) != SKETCH_VERSION:
+                raise ValueError(
+                    f"User sketches '{filename}' have version {int(data['version'])}, "
+                    f"expected {SKETCH_VERSION}. Please re-run user_thresholds.py."
+                )
+            relative_accuracy, min_value, max_value = data['params'].tolist()
+            sketches = cls(relative_accuracy, min_value, max_value)
+            sketches._users = {str(user): row for row, user in enumerate(data['users'])}
+            sketches._counts = data['counts'].astype(np.uint32)
+        return sketches
+
+
+def seed_user_sketches(engine='keras', output=SKETCH_FILENAME):
+    """
+    Builds every user's sketch from the reconstruction errors of their
+    normal training events, so the live app starts with per-user
+    thresholds instead of learning them from scratch.
+    """
+    # Imported here, so app.py can use the sketches without the training stack
+    from calibrate_threshold import score_labeled_events
+    from event_store import LABELED_EVENTS_STORE, load_events
+    from feature_cache import LABELED_FILENAME
+
+    print(f"Scoring the labeled events ({engine} engine)...")
+    errors, y_true, manifest = score_labeled_events(engine)
+    # The feature cache keeps the row order of the labeled events
+    user_ids = load_events(LABELED_EVENTS_STORE, LABELED_FILENAME, columns=['user_id'])['user_id'].to_numpy()
+    if len(user_ids) != len(errors):
+        raise ValueError("The labeled data changed while scoring; please re-run.")
+
+    normal = y_true == 0
+    sketches = UserErrorSketches()
+    sketches.add_many(user_ids[normal], errors[normal])
+    sketches.save(output)
+    print(f"Seeded sketches for {len(sketches)} users from {int(normal.sum())} normal events "
+          f"({sketches.memory_bytes / 1024:.0f} KiB, {sketches.n_bins} bins per user).")
+    print(f"Saved to '{output}'; app.py loads it at startup.")
+    return sketches
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Seed the per-user error sketches from the labeled data.")
+    parser.add_argument('--engine', choices=['keras', 'numpy'], default='keras',
+                        help="Score with final_autoencoder_model.h5 or the exported NumPy weights.")
+    parser.add_argument('--output', default=SKETCH_FILENAME, help="Where to write the sketches.")
+    args = parser.parse_args()
+
+    try:
+        seed_user_sketches(args.engine, args.output)
+    except (FileNotFoundError, ValueError) as e:
+        print(f"Error: {e}")
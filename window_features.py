@@ -0,0 +1,189 @@
+import threading
+from collections import deque
+
+import numpy as np
+import pandas as pd
+
+# Per-user sliding-window features, in this column order everywhere
+WINDOW_FEATURES = ['events_last_1h', 'events_last_24h', 'distinct_hosts_last_24h', 'usb_connects_last_24h']
+
+HOUR_SECONDS = 3600
+DAY_SECONDS = 24 * HOUR_SECONDS
+
+# Upper bound on (event, host) pairs expanded at once in batch mode
+MAX_EXPANDED_PAIRS = 10_000_000
+
+# How much event time passes between sweeps for idle users in streaming mode
+PRUNE_INTERVAL_SECONDS = HOUR_SECONDS
+
+
+# Every window covers (t - length, t] of the user's events up to and
+# including the current one. Timestamps count in whole seconds in both
+# implementations, so they agree exactly.
+def _to_seconds(timestamps):
+    timestamps = pd.to_datetime(pd.Series(timestamps).reset_index(drop=True))
+    valid = timestamps.notna().to_numpy()
+    seconds = np.zeros(len(timestamps), dtype=np.int64)
+    seconds[valid] = timestamps[valid].to_numpy().astype('datetime64[s]').astype(np.int64)
+    return seconds, valid
+
+
+def _normalize(values, n):
+    if values is None:
+        return np.full(n, 'missing', dtype=object)
+    return pd.Series(values).reset_index(drop=True).astype(object).fillna('missing').astype(str).to_numpy(dtype=object)
+
+
+def _is_usb_connect(event_types, activities, n):
+    return (_normalize(event_types, n) == 'device') & (_normalize(activities, n) == 'Connect')
+
+
+def compute_window_features(user_ids, timestamps, hostnames, event_types, activities):
+    """
+    Vectorized batch version, for training. Events are sorted once by
+    (user, time) into a single integer key, so each window start is one
+    `np.searchsorted` for all events. Counts come from positions and a
+    cumulative sum; distinct hosts from checking, for every host the user
+    has, whether its last use falls inside the window. Returns an
+    (events x WINDOW_FEATURES) array, NaN for events without a timestamp.
+    """
+    n = len(user_ids)
+    features = np.full((n, len(WINDOW_FEATURES)), np.nan)
+    seconds, valid = _to_seconds(timestamps)
+    rows = np.flatnonzero(valid)
+    if rows.size == 0:
+        return features
+
+    user_codes = pd.factorize(_normalize(user_ids, n)[rows])[0]
+    hosts = _normalize(hostnames, n)[rows]
+    is_usb = _is_usb_connect(event_types, activities, n)[rows]
+    seconds = seconds[rows] - seconds[rows].min()
+
+    # --- 1. One Sorted (user, time) Key ---
+    # Stable, so events with equal timestamps keep their input order
+    order = np.lexsort((seconds, user_codes))
+    stride = int(seconds.max()) + DAY_SECONDS + 1
+    keys = user_codes[order].astype(np.int64) * stride + seconds[order]
+    positions = np.arange(len(order))
+
+    starts = {}
+    for name, length in (('1h', HOUR_SECONDS), ('24h', DAY_SECONDS)):
+        starts[name] = np.searchsorted(keys, keys - length, side='right')
+    sorted_features = np.empty((len(order), len(WINDOW_FEATURES)))
+    sorted_features[:, 0] = positions - starts['1h'] + 1
+    sorted_features[:, 1] = positions - starts['24h'] + 1
+
+    usb_before = np.concatenate(([0], np.cumsum(is_usb[order])))
+    sorted_features[:, 3] = usb_before[positions + 1] - usb_before[starts['24h']]
+
+    # --- 2. Distinct Hosts by Host Expansion ---
+    sorted_users = user_codes[order]
+    pair_codes, pair_index = pd.factorize(pd.MultiIndex.from_arrays([sorted_users, hosts[order]]))
+    pair_users = pair_index.get_level_values(0).to_numpy()
+    # The user's hosts, grouped by user
+    user_pairs = np.argsort(pair_users, kind='stable')
+    hosts_per_user = np.bincount(pair_users, minlength=sorted_users.max() + 1)
+    first_pair = np.concatenate(([0], np.cumsum(hosts_per_user)[:-1]))
+    # Where each host was used, as sorted (host pair, position) keys
+    use_keys = np.sort(pair_codes.astype(np.int64) * len(order) + positions)
+
+    expanded_sizes = hosts_per_user[sorted_users]
+    distinct = np.zeros(len(order))
+    block_start = 0
+    while block_start < len(order):
+        # Bounded blocks, so users with many hosts cannot exhaust memory
+        sizes = np.cumsum(expanded_sizes[block_start:])
+        block_end = block_start + max(1, int(np.searchsorted(sizes, MAX_EXPANDED_PAIRS, side='right')))
+        block = positions[block_start:block_end]
+        counts = expanded_sizes[block]
+        event = np.repeat(block, counts)
+        offset = np.arange(len(event)) - np.repeat(np.cumsum(counts) - counts, counts)
+        pair = user_pairs[first_pair[sorted_users[event]] + offset]
+        # The host's last use at or before this event...
+        last_use = np.searchsorted(use_keys, pair * len(order) + event, side='right') - 1
+        used = (last_use >= 0) & (use_keys[np.maximum(last_use, 0)] // len(order) == pair)
+        last_position = use_keys[np.maximum(last_use, 0)] % len(order)
+        # ...counts if it is inside the event's 24h window
+        in_window = used & (last_position >= starts['24h'][event])
+        distinct[block] = np.bincount(event - block[0], weights=in_window, minlength=len(block))
+        block_start = block_end
+    sorted_features[:, 2] = distinct
+
+    features[rows[order]] = sorted_features
+    return features
+
+
+class WindowFeatureState:
+    """
+    Streaming version for the live app. Each user keeps the timestamps of
+    their last hour and the (time, host, USB) entries of their last day in
+    deques, plus per-host and USB counts for that day. Every event is
+    appended and expired exactly once, so updates are O(1) amortized.
+    Given events in time order per user, it returns exactly what
+    `compute_window_features` returns for the same events.
+
+    Users whose newest event has left even the 24h window are dropped
+    every PRUNE_INTERVAL_SECONDS of event time, so memory is bounded by
+    the users active in the last day, as with DailyActivityCounter. Like
+    its late events, an event older than a dropped user's history only
+    sees the windows from there on.
+    """
+
+    def __init__(self):
+        self._users = {}
+        self._latest = None
+        self._last_prune = None
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._users)
+
+    def _prune(self):
+        # A user's newest event is the last one in their 24h deque
+        cutoff = self._latest - DAY_SECONDS
+        idle = [user for user, state in self._users.items() if not state[1] or state[1][-1][0] <= cutoff]
+        for user in idle:
+            del self._users[user]
+        self._last_prune = self._latest
+
+    def _update(self, user, now, host, is_usb):
+        state = self._users.get(user)
+        if state is None:
+            state = self._users[user] = [deque(), deque(), {}, 0]
+        last_hour, last_day, host_counts, usb_connects = state
+
+        while last_hour and last_hour[0] <= now - HOUR_SECONDS:
+            last_hour.popleft()
+        while last_day and last_day[0][0] <= now - DAY_SECONDS:
+            _, old_host, old_usb = last_day.popleft()
+            host_counts[old_host] -= 1
+            if not host_counts[old_host]:
+                del host_counts[old_host]
+            usb_connects -= old_usb
+
+        last_hour.append(now)
+        last_day.append((now, host, is_usb))
+        host_counts[host] = host_counts.get(host, 0) + 1
+        usb_connects += is_usb
+        state[3] = usb_connects
+        return len(last_hour), len(last_day), len(host_counts), usb_connects
+
+    def update_many(self, user_ids, timestamps, hostnames, event_types, activities):
+        """Adds a batch of events in order and returns their features."""
+        n = len(user_ids)
+        features = np.full((n, len(WINDOW_FEATURES)), np.nan)
+        seconds, valid = _to_seconds(timestamps)
+        users = _normalize(user_ids, n)
+        hosts = _normalize(hostnames, n)
+        is_usb = _is_usb_connect(event_types, activities, n).astype(int)
+        with self._lock:
+            for i in np.flatnonzero(valid):
+                features[i] = self._update(users[i], int(seconds[i]), hosts[i], int(is_usb[i]))
+            if valid.any():
+                newest = int(seconds[valid].max())
+                self._latest = newest if self._latest is None else max(self._latest, newest)
+                if self._last_prune is None:
+                    self._last_prune = self._latest
+                elif self._latest - self._last_prune >= PRUNE_INTERVAL_SECONDS:
+                    self._prune()
+        return features